@@ -1,40 +1,53 @@
+import os
+
 import numpy as np
 
+import raw_text
+import raw_container
+import resolution
+
 def converter_texto_para_binario(input_path, output_path):
     try:
-        # 1. Lê o arquivo como texto normal
-        with open(input_path, 'r') as f:
-            content = f.read()
+        # 1. Lê o arquivo texto em pedaços e converte cada pedaço de uma vez (raw_text),
+        #    ignorando o que não for número sem sinal, como antes (signed=False: '-5' é pulado);
+        #    um número acima de 255 interrompe a conversão
+        # 2. Grava os pixels (uint8) de cada pedaço direto no binário puro (.raw),
+        #    sem carregar o arquivo inteiro na memória
+        # 3. Se a saída for .praw, reserva o cabeçalho antes dos pixels e o regrava no fim com as
+        #    dimensões mais prováveis (o tamanho do cabeçalho não muda, só a forma)
+        container = raw_container.is_container_path(output_path)
+        provenance = raw_container.make_provenance(source=input_path)
+        total_pixels = 0
+        with open(output_path, 'wb') as out:
+            offset = raw_container.write_header(out, (0,), np.uint8, provenance=provenance) if container else 0
+            for array_pixels in raw_text.iter_text_pixels(input_path, signed=False):
+                array_pixels.tofile(out)
+                total_pixels += array_pixels.size
+            out.flush()
 
-        # 2. Remove tags estranhas se houver (como "") 
-        # e converte tudo que é número para uma lista
-        # (O split() separa por qualquer espaço ou quebra de linha)
-        numeros_texto = content.replace('', '').split()
-        
-        # Filtra apenas o que é dígito (para evitar erros com palavras soltas)
-        pixels = []
-        for x in numeros_texto:
-            # Tenta converter para inteiro se parecer um número
-            if x.replace('.', '', 1).isdigit(): 
-                pixels.append(int(float(x))) # float para garantir caso tenha ponto
+            candidatos = []
+            if total_pixels:
+                # Tenta adivinhar dimensão (pela semelhança entre linhas vizinhas)
+                pixels = np.memmap(output_path, dtype=np.uint8, mode='r', offset=offset, shape=(total_pixels,))
+                candidatos = resolution.rank_resolutions(pixels)
+            if container:
+                shape = (candidatos[0][1], candidatos[0][0]) if candidatos else (total_pixels,)
+                out.seek(0)
+                raw_container.write_header(out, shape, np.uint8, provenance=provenance)
 
-        # 3. Converte para array numpy de 8 bits (uint8)
-        array_pixels = np.array(pixels, dtype=np.uint8)
-
-        # 4. Salva como binário puro (.raw)
-        array_pixels.tofile(output_path)
-        
         print(f"Sucesso! Arquivo convertido.")
-        print(f"Tamanho original (texto): {len(content)} caracteres")
-        print(f"Tamanho novo (binário): {len(array_pixels)} bytes")
+        print(f"Tamanho original (texto): {os.path.getsize(input_path)} bytes")
+        print(f"Tamanho novo (binário): {total_pixels} bytes")
         
-        # Tenta adivinhar dimensão para te avisar
-        import math
-        raiz = math.sqrt(len(array_pixels))
-        if int(raiz) * int(raiz) == len(array_pixels):
-            print(f"Parece ser uma imagem {int(raiz)}x{int(raiz)}")
+        # Avisa a dimensão encontrada
+        if candidatos:
+            w, h, _ = candidatos[0]
+            print(f"Parece ser uma imagem {w}x{h}" + (" (gravada no cabeçalho)" if container else ""))
+            outras = ", ".join(f"{w}x{h}" for w, h, _ in candidatos[1:4])
+            if outras:
+                print(f"Outras possibilidades: {outras}")
             
     except Exception as e:
         print(f"Erro: {e}")
 
-converter_texto_para_binario('circulo.raw', 'circulo_binario.raw')
\ No newline at end of file
+converter_texto_para_binario('circulo.raw', 'circulo_binario.raw')
@@ -3,10 +3,12 @@ import numpy as np
 from PIL import Image
 from PySide6.QtWidgets import QApplication, QFileDialog
 
+import raw_container
+
 def converter_jpg_para_raw():
     """
     Abre um diálogo para selecionar um JPG/PNG, converte para 
-    8-bit grayscale RAW e o salva.
+    8-bit grayscale RAW e o salva (.praw guarda as dimensões no próprio arquivo).
     """
     
     # 1. Pergunta ao usuário qual JPG/PNG abrir
@@ -34,8 +36,8 @@ def converter_jpg_para_raw():
         output_path, _ = QFileDialog.getSaveFileName(
             None,
             "Salvar Como Arquivo RAW",
-            "imagem_convertida.raw",
-            "RAW Files (*.raw)"
+            "imagem_convertida.praw",
+            "RAW com cabeçalho (*.praw);;RAW puro (*.raw)"
         )
         
         if not output_path:
@@ -46,12 +48,15 @@ def converter_jpg_para_raw():
         #    Isso garante que temos os bytes puros em uint8
         img_array = np.array(img, dtype=np.uint8)
 
-        # 5. Salva o array de bytes puros no arquivo .raw
-        img_array.tofile(output_path)
+        # 5. Salva o array: com cabeçalho (.praw) ou só os bytes puros (.raw)
+        raw_container.save_raw(output_path, img_array, raw_container.make_provenance(source=input_path))
         
         print(f"\n--- SUCESSO! ---")
         print(f"Arquivo RAW salvo em: {output_path}")
         print(f"Tamanho: {img_array.size} bytes.")
+        if raw_container.is_container_path(output_path):
+            print("Largura e altura ficam gravadas no arquivo: o PSE-Image as lê sozinho.")
+            return
         print("\nIMPORTANTE:")
         print("Ao carregar este arquivo no seu PSE-Image, use:")
         print(f"  Largura: {width}")
@@ -1,7 +1,7 @@
 import sys
 import numpy as np 
 import os    
-import math
+import threading
 from io import BytesIO
 from PIL import Image
 
@@ -14,10 +14,10 @@ from PySide6.QtWidgets import (
     QApplication, QMainWindow, QGraphicsView, QGraphicsScene, 
     QDockWidget, QListWidget, QGraphicsItem, QGraphicsPathItem,
     QGraphicsEllipseItem, QWidget, QVBoxLayout, QLabel,
-    QMenu, QPushButton, QSpinBox, QFormLayout, QLineEdit, 
+    QMenu, QPushButton, QSpinBox, QDoubleSpinBox, QFormLayout, QLineEdit, 
     QErrorMessage, QFileDialog, QComboBox, QDialog, QHBoxLayout, QTextEdit
 )
-from PySide6.QtCore import Qt, QPointF, QRectF, QByteArray
+from PySide6.QtCore import Qt, QPointF, QRectF, QByteArray, QObject, QRunnable, QThreadPool, QTimer, Signal
 from PySide6.QtGui import (
     QPen, QBrush, QPainterPath, QColor, QTransform, QFont, QAction,
     QImage, QPixmap 
@@ -25,6 +25,36 @@ from PySide6.QtGui import (
 
 import qimage2ndarray 
 import processing_utils as pu
+import flow_graph
+import result_cache
+import pipeline
+import profiling
+import raw_text
+import raw_container
+import raw_chunked
+import resolution
+
+# Threads usadas para executar blocos independentes do fluxo (None = padrão do ThreadPoolExecutor)
+FLOW_WORKERS = None
+
+# Maior lado (em pixels) da imagem no modo de prévia rápida
+PREVIEW_MAX_SIDE = 1024
+
+# Espera (ms) depois da última edição de parâmetro antes de reprocessar no modo ao vivo
+LIVE_DEBOUNCE_MS = 300
+
+# Estado inicial do botão "Medir Memória": rastrear a memória de pico de cada bloco com tracemalloc deixa
+# a execução várias vezes mais lenta, então só é ligado quando o relatório de memória interessa
+PROFILE_MEMORY = False
+
+# Cores do indicador de execução desenhado em cada bloco
+RUN_STATE_COLORS = {
+    "pending": "lightgray",
+    "running": "gold",
+    "done": "limegreen",
+    "error": "red",
+    "cancelled": "darkorange",
+}
 
 # --- 1. CLASSE NodeConnector ---
 
@@ -52,6 +82,9 @@ class NodeConnector(QGraphicsEllipseItem):
 
 class NodeBlock(QGraphicsItem):
     """ Classe base para todos os blocos de processamento. """
+    cacheable = False # True nas subclasses cujo resultado vale a pena guardar no cache
+    transient_parameters = () # chaves de 'parameters' escritas pelo próprio process (não entram na chave)
+
     def __init__(self, title, scene):
         super().__init__()
         self.title = title
@@ -63,6 +96,12 @@ class NodeBlock(QGraphicsItem):
         self.output_data = None 
         self.parameters = {}    
         self.input_connections = {} 
+        self.dirty = True # precisa ser (re)processado no próximo "Processar Fluxo"
+        self.dirty_generation = 0 # muda a cada mark_dirty: uma execução só limpa 'dirty' se nada mudou desde que começou
+        self.output_key = None # chave (por conteúdo) do resultado atual, usada pelos blocos abaixo
+        self.run_state = None # estado da última execução: pending, running, done, error ou cancelled
+        self.profile = None # medidas da última execução (profiling.BlockProfile)
+        self.scale = 1 # redução da imagem de saída em relação à resolução total (>1 no modo de prévia)
         
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
@@ -76,6 +115,34 @@ class NodeBlock(QGraphicsItem):
     def remove_input(self, input_connector):
         if input_connector in self.input_connections:
             del self.input_connections[input_connector]
+
+    def input_block(self, index=0):
+        """ Bloco ligado à entrada 'index' (ou None se não houver conexão). """
+        if index < len(self.inputs):
+            return self.input_connections.get(self.inputs[index][0])
+        return None
+
+    def mark_dirty(self):
+        """ Marca este bloco e todo o subgrafo abaixo dele para reprocessamento. """
+        stack = [self]
+        visited = set()
+        while stack:
+            block = stack.pop()
+            if block in visited:
+                continue
+            visited.add(block)
+            block.dirty = True
+            block.dirty_generation += 1
+            stack.extend(block.downstream_blocks())
+
+    def downstream_blocks(self):
+        """ Blocos ligados às saídas deste bloco (sem repetição). """
+        blocks = []
+        for conn, _ in self.outputs:
+            for wire in conn.wires:
+                if wire.end_conn and wire.end_conn.parent_block not in blocks:
+                    blocks.append(wire.end_conn.parent_block)
+        return blocks
             
     def process(self):
         """ Lógica de processamento padrão (pass-through). """
@@ -86,6 +153,86 @@ class NodeBlock(QGraphicsItem):
                 self.output_data = input_block.output_data
                 print(f"Processando {self.title}: dados copiados.")
             
+    def source_scale(self):
+        """ Redução (prévia) da imagem que chega a este bloco: a maior entre as entradas. """
+        scales = [b.scale for b in (self.input_block(i) for i in range(len(self.inputs))) if b is not None]
+        return max(scales, default=1)
+
+    def cache_key(self):
+        """ Chave do resultado: tipo do bloco, parâmetros e chaves das entradas. """
+        input_keys = []
+        for i in range(len(self.inputs)):
+            block = self.input_block(i)
+            input_keys.append(block.output_key if block is not None else None)
+        return result_cache.make_key(type(self).__name__, self.parameters, input_keys,
+                                     ignore=self.transient_parameters)
+
+    def is_cacheable(self):
+        return self.cacheable
+
+    def cache_state(self):
+        """ O que precisa ser guardado para restaurar o resultado sem reprocessar. """
+        return self.output_data
+
+    def restore_state(self, state):
+        self.output_data = state
+
+    def finish(self):
+        """ Parte do processamento que mexe no Qt (pixmaps, redesenho); roda sempre na thread da interface. """
+        self.update()
+
+    def set_run_state(self, state):
+        self.run_state = state
+        self.update()
+
+    def paint_status(self, painter):
+        """ Indicador da última execução no canto superior direito e tempo do bloco no canto inferior direito. """
+        color = RUN_STATE_COLORS.get(self.run_state)
+        if color is None:
+            return
+        painter.setPen(QPen(Qt.GlobalColor.black, 1))
+        painter.setBrush(QBrush(QColor(color)))
+        painter.drawEllipse(QRectF(self.width - 16, 7, 10, 10))
+        if self.profile is not None and self.run_state == "done":
+            badge_font = QFont()
+            badge_font.setPointSize(7)
+            painter.setFont(badge_font)
+            rect = QRectF(self.width - 66, self.height - 18, 60, 14)
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QBrush(QColor(255, 255, 255, 200)))
+            painter.drawRoundedRect(rect, 3, 3)
+            painter.setPen(QPen(Qt.GlobalColor.darkGray))
+            painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, self.profile.badge())
+
+    def execute(self, cache=None, profiler=None):
+        """ Executa process(), reaproveitando o resultado do cache quando a chave já foi calculada.
+        Com um profiler, as medidas do bloco ficam em self.profile. """
+        if profiler is None:
+            self._execute(cache)
+            return
+        with profiler.measure(self.title, id(self)) as record:
+            record.cached = self._execute(cache)
+            record.set_output(self.output_data)
+        self.profile = record
+
+    def _execute(self, cache):
+        """ Retorna True se o resultado veio do cache. """
+        self.scale = self.source_scale()
+        key = self.cache_key()
+        use_cache = cache is not None and self.is_cacheable()
+        if use_cache:
+            state = cache.get(key)
+            if state is not None:
+                self.restore_state(state)
+                self.output_key = key
+                print(f"{self.title}: resultado reaproveitado do cache.")
+                return True
+        self.process()
+        self.output_key = key
+        if use_cache and self.output_data is not None:
+            cache.put(key, self.cache_state())
+        return False
+
     def add_connector(self, label, is_input):
         connector = NodeConnector(self, is_input)
         if is_input:
@@ -121,6 +268,7 @@ class NodeBlock(QGraphicsItem):
         painter.setFont(title_font)
         painter.setPen(QPen(Qt.GlobalColor.black))
         painter.drawText(QRectF(5, 5, self.width - 10, 20), self.title)
+        self.paint_status(painter)
 
     def itemChange(self, change, value):
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
@@ -133,11 +281,33 @@ class NodeBlock(QGraphicsItem):
 
 class BlockRawInput(NodeBlock):
     """ Bloco de Leitura RAW. """
+    def __init__(self, title, scene):
+        super().__init__(title, scene)
+        self.image_data = None # imagem carregada, em resolução total
+        self.preview_max_side = None # definido pela janela no modo de prévia rápida
+
+    def source_scale(self):
+        if self.image_data is None or not self.preview_max_side:
+            return 1
+        return pipeline.preview_factor(self.image_data.shape, self.preview_max_side)
+
+    def cache_key(self):
+        # A origem dos dados é o próprio array carregado: a chave é o hash do conteúdo, ou a identidade do
+        # arquivo quando ele está mapeado em memória (result_cache.array_key), e a redução da prévia
+        return result_cache.make_key(type(self).__name__, {"scale": self.scale},
+                                     [result_cache.array_key(self.image_data)])
+
     def process(self):
-        if self.output_data is not None:
-            print(f"Processando {self.title}: Dados prontos.")
-        else:
+        if self.image_data is None:
+            self.output_data = None
             print(f"Processando {self.title}: Sem dados.")
+        elif self.scale > 1:
+            self.output_data = pu.downsample_mean(self.image_data, self.scale)
+            h, w = self.output_data.shape
+            print(f"Processando {self.title}: Prévia {w}x{h} (1/{self.scale}).")
+        else:
+            self.output_data = self.image_data
+            print(f"Processando {self.title}: Dados prontos.")
 
 
 class BlockRawOutput(NodeBlock):
@@ -165,16 +335,21 @@ class BlockRawOutput(NodeBlock):
         else:
             print(f"{self.title}: Sem dados de entrada.")
 
-    def save_to_file(self, path):
-        """ Chamado pelo botão 'Salvar agora' na interface. """
-        if self.data_to_save is None:
+    def save_to_file(self, path, data=None, provenance=None, codec=None):
+        """ Chamado pelo botão 'Salvar agora' na interface. 'data' substitui os dados do fluxo
+        (resolução total calculada à parte quando o fluxo rodou em prévia). Arquivos .praw são gravados
+        com cabeçalho (dimensões, tipo e a procedência dada), .craw em tiles comprimidos com 'codec' (por
+        padrão o do bloco) e os demais como RAW puro. """
+        if data is None:
+            data = self.data_to_save
+        if data is None:
             raise ValueError("Não há dados processados para salvar. Execute o fluxo primeiro.")
         
         try:
-            # Garante que os dados sejam uint8 antes de salvar
-            # Usa astype do numpy para converter
-            data_uint8 = self.data_to_save.astype(np.uint8)
-            data_uint8.tofile(path)
+            # Garante que os dados sejam uint8 antes de salvar (feito em raw_container.save_raw)
+            if codec is None:
+                codec = self.parameters.get("codec", raw_chunked.DEFAULT_CODEC)
+            raw_container.save_raw(path, data, provenance, codec)
             return True
         except Exception as e:
             raise RuntimeError(f"Erro ao escrever arquivo: {e}")
@@ -188,11 +363,13 @@ class BlockDisplay(NodeBlock):
         self.width = 256 + 20 # 256px para imagem + 10px padding de cada lado
         self.height = 256 + 40 # 256px para imagem + 30px título + 10px padding
         self.pixmap = None # O QPixmap a ser desenhado
+        self.image = None # QImage gerada no processamento (pode ser criada fora da thread da interface)
 
     def process(self):
-        """ Pega os dados da entrada e os converte em um QPixmap. """
+        """ Pega os dados da entrada e os converte em uma QImage. """
         print(f"Processando {self.title}...")
         image_data = None
+        self.image = None
         
         if self.inputs:
             input_conn = self.inputs[0][0] 
@@ -202,17 +379,17 @@ class BlockDisplay(NodeBlock):
         
         if image_data is not None:
             try:
-                image = qimage2ndarray.array2qimage(image_data, normalize=False)
-                
-                self.pixmap = QPixmap.fromImage(image)
-                print("BlockDisplay: Pixmap criado.")
+                self.image = qimage2ndarray.array2qimage(image_data, normalize=False)
             except Exception as e:
                 print(f"BlockDisplay: Erro ao converter imagem: {e}")
-                self.pixmap = None
         else:
             print("BlockDisplay: Sem dados de entrada.")
-            self.pixmap = None
-        
+
+    def finish(self):
+        """ QPixmap só pode ser criado na thread da interface. """
+        self.pixmap = QPixmap.fromImage(self.image) if self.image is not None else None
+        if self.pixmap is not None:
+            print("BlockDisplay: Pixmap criado.")
         # Força um redesenho do bloco
         self.update()
 
@@ -249,42 +426,63 @@ class BlockDisplay(NodeBlock):
         else:
             painter.setPen(QPen(Qt.GlobalColor.gray))
             painter.drawText(img_rect, Qt.AlignmentFlag.AlignCenter, "Sem imagem")
+        self.paint_status(painter) # por cima da imagem
  
 class BlockPunctual(NodeBlock):
     """ Bloco de Processamento Pontual. """
+    cacheable = True
+
     def __init__(self, title, scene):
         super().__init__(title, scene)
         self.parameters.setdefault("operation", "Brilho")
         self.parameters.setdefault("brightness", 0)
         self.parameters.setdefault("threshold", 128)
+        self.parameters.setdefault("gamma", 1.0)
+        self.parameters.setdefault("stretch_low", 0)
+        self.parameters.setdefault("stretch_high", 255)
+
+    def point_lut(self):
+        """ LUT de 256 entradas equivalente à operação configurada. """
+        return pipeline.punctual_lut(self.parameters)
+
+    def fuses_into_next(self):
+        """ True se a única saída alimenta outro bloco pontual, que aplica a LUT composta. """
+        next_blocks = self.downstream_blocks()
+        return len(next_blocks) == 1 and isinstance(next_blocks[0], BlockPunctual)
+
+    def is_cacheable(self):
+        # Bloco fundido com o próximo não produz saída própria: não há o que guardar
+        return not self.fuses_into_next()
 
     def process(self):
         print(f"Processando {self.title}...")
-        super().process()
-        img = self.output_data
-        if img is None and self.inputs:
-            input_conn = self.inputs[0][0]
-            if input_conn in self.input_connections:
-                img = self.input_connections[input_conn].output_data
+        if self.fuses_into_next():
+            # O resultado intermediário não é usado por mais ninguém: o próximo bloco aplica as duas LUTs de uma vez
+            self.output_data = None
+            print(f"{self.title}: operação fundida com o próximo bloco pontual.")
+            return
+
+        # Sobe pela cadeia de blocos pontuais fundidos, compondo as LUTs
+        luts = [self.point_lut()]
+        source = self.input_block()
+        while isinstance(source, BlockPunctual) and source.fuses_into_next():
+            luts.append(source.point_lut())
+            source = source.input_block()
+        luts.reverse() # o bloco mais acima é aplicado primeiro
 
+        img = source.output_data if source is not None else None
         if img is None:
             self.output_data = None
             print(f"{self.title}: sem imagem de entrada.")
             return
 
-        op = self.parameters.get("operation", "Brilho")
-        if op == "Brilho":
-            delta = int(self.parameters.get("brightness", 0))
-            self.output_data = pu.adjust_brightness(img, delta)
-        elif op == "Limiar":
-            t = int(self.parameters.get("threshold", 128))
-            self.output_data = pu.threshold(img, t)
-        else:
-            self.output_data = img
-        print(f"{self.title}: operação {op} aplicada.")
+        self.output_data = pu.apply_lut(img, pu.compose_luts(*luts))
+        print(f"{self.title}: operação {self.parameters.get('operation', 'Brilho')} aplicada ({len(luts)} LUT(s) em uma passada).")
 
 class BlockConvolution(NodeBlock):
     """ Máscara de Convolução / filtros. """
+    cacheable = True
+
     def __init__(self, title, scene):
         super().__init__(title, scene)
         self.parameters.setdefault("kernel_text", "1 1 1\n1 1 1\n1 1 1")
@@ -304,40 +502,39 @@ class BlockConvolution(NodeBlock):
             return
 
         preset = self.parameters.get("preset", "Média")
-        if preset == "Média":
-            k = np.ones((3,3), dtype=np.float64) / 9.0
-            out = pu.convolve2d(img, k)
-        elif preset == "Laplaciano":
-            k = np.array([[0,1,0],[1,-4,1],[0,1,0]], dtype=np.float64)
-            out = pu.convolve2d(img, k)
-        elif preset == "Mediana":
-            size = int(self.parameters.get("median_size", 3))
-            out = pu.median_filter(img, size)
-        elif preset == "Personalizado":
-            text = self.parameters.get("kernel_text", "")
-            k = pu.kernel_from_text(text)
-            if k is None:
-                print("Kernel inválido; passando imagem sem alteração.")
-                out = img
-            else:
-                out = pu.convolve2d(img, k)
-        else:
-            out = img
-        self.output_data = out
-        print(f"{self.title}: filtro '{preset}' aplicado.")
+        # Na prévia, janelas grandes encolhem junto com a imagem
+        params = pipeline.scale_parameters(self.parameters, self.scale)
+        self.output_data = pipeline.apply_convolution(img, params)
+        print(f"{self.title}: filtro '{preset}' aplicado" + (f" (prévia 1/{self.scale})." if self.scale > 1 else "."))
 
 class BlockHistogram(NodeBlock):
     """ Bloco que calcula e EXIBE o histograma internamente. """
+    cacheable = True
+
     def __init__(self, title, scene):
         super().__init__(title, scene)
         self.width = 300 
         self.height = 220 
         self.pixmap = None 
+        self.chart_png = None # gráfico renderizado (PNG), convertido em QPixmap na thread da interface
+
+    def cache_state(self):
+        return (self.output_data, self.chart_png)
+
+    def restore_state(self, state):
+        self.output_data, self.chart_png = state
+
+    def finish(self):
+        self.pixmap = None
+        if self.chart_png is not None:
+            self.pixmap = QPixmap()
+            self.pixmap.loadFromData(self.chart_png)
+        self.update()
 
     def process(self):
         print(f"Processando {self.title}...")
         img = None
-        self.pixmap = None 
+        self.chart_png = None 
         
         if self.inputs:
             input_conn = self.inputs[0][0]
@@ -347,7 +544,6 @@ class BlockHistogram(NodeBlock):
         if img is None:
             self.output_data = None
             print(f"{self.title}: sem imagem de entrada.")
-            self.update() 
             return
 
         self.output_data = img  
@@ -367,18 +563,14 @@ class BlockHistogram(NodeBlock):
             
             buf = BytesIO()
             fig.savefig(buf, format='png', transparent=True)
-            buf.seek(0)
             
-            self.pixmap = QPixmap()
-            self.pixmap.loadFromData(buf.getvalue())
+            self.chart_png = buf.getvalue()
             
             print(f"{self.title}: Gráfico gerado.")
             
         except Exception as e:
             print(f"Erro ao gerar gráfico: {e}")
 
-        self.update() 
-
     def boundingRect(self):
         return QRectF(0, 0, self.width, self.height)
 
@@ -398,6 +590,7 @@ class BlockHistogram(NodeBlock):
         painter.setFont(title_font)
         painter.setPen(QPen(Qt.GlobalColor.black))
         painter.drawText(QRectF(5, 5, self.width - 10, 20), self.title)
+        self.paint_status(painter)
         
         # Desenha o gráfico
         graph_rect = QRectF(10, 35, self.width - 20, self.height - 45)
@@ -417,6 +610,15 @@ class BlockHistogram(NodeBlock):
 
 class BlockDifference(NodeBlock):
     """ Bloco de Diferença. """
+    cacheable = True
+    transient_parameters = ("metrics",)
+
+    def cache_state(self):
+        return (self.output_data, self.parameters.get('metrics'))
+
+    def restore_state(self, state):
+        self.output_data, self.parameters['metrics'] = state
+
     def process(self):
         print(f"Processando {self.title}...")
         img_a = None
@@ -440,7 +642,7 @@ class BlockDifference(NodeBlock):
         diff_img, metrics = pu.img_diff(img_a, img_b)
         self.output_data = diff_img
         self.parameters['metrics'] = metrics
-        print(f"{self.title}: diferença calculada. MSE={metrics.get('mse'):.2f}, PSNR={metrics.get('psnr')}")
+        print(f"{self.title}: diferença calculada. MSE={metrics.get('mse'):.2f}, PSNR={metrics.get('psnr')}, SSIM={metrics.get('ssim'):.4f}")
 
 # --- 4. CLASSE ConnectionWire ---
 class ConnectionWire(QGraphicsPathItem):
@@ -456,7 +658,19 @@ class ConnectionWire(QGraphicsPathItem):
         scene.addItem(self)
         self.setZValue(-1) 
         
+    def start_fuses(self):
+        """ Se o bloco de origem funde sua LUT com o próximo (isso depende do que está ligado abaixo dele). """
+        block = self.start_conn.parent_block if self.start_conn else None
+        return isinstance(block, BlockPunctual) and block.fuses_into_next()
+
+    def mark_start_if_fusion_changed(self, fused_before):
+        """ Um bloco pontual que deixou de fundir (ou passou a fundir) precisa rodar de novo: sua saída
+        própria passa a existir (ou a não existir). """
+        if self.start_conn and self.start_fuses() != fused_before:
+            self.start_conn.parent_block.mark_dirty()
+
     def set_end_connector(self, connector):
+        fused_before = self.start_fuses()
         self.end_conn = connector
         self.start_conn.wires.append(self)
         self.end_conn.wires.append(self)
@@ -465,6 +679,8 @@ class ConnectionWire(QGraphicsPathItem):
             self.end_conn, 
             self.start_conn.parent_block
         )
+        self.end_conn.parent_block.mark_dirty()
+        self.mark_start_if_fusion_changed(fused_before)
         self.update_path()
 
     def update_temp_end_pos(self, pos):
@@ -483,6 +699,7 @@ class ConnectionWire(QGraphicsPathItem):
         self.setPath(path)
         
     def disconnect(self):
+        fused_before = self.start_fuses()
         if self.start_conn:
             try:
                 self.start_conn.wires.remove(self)
@@ -497,6 +714,8 @@ class ConnectionWire(QGraphicsPathItem):
                 self.end_conn.wires.remove(self)
             except ValueError:
                 pass
+            self.end_conn.parent_block.mark_dirty()
+        self.mark_start_if_fusion_changed(fused_before)
 
     def paint(self, painter, option, widget=None):
         # Verifica se o item está selecionado
@@ -514,9 +733,13 @@ class FlowScene(QGraphicsScene):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.draft_wire = None 
+        self.locked = False # True durante uma execução: o worker lê as ligações, então elas não mudam
         self.setBackgroundBrush(QBrush(QColor(50, 50, 50)))
 
     def start_connection(self, connector):
+        if self.locked:
+            print("Aguarde o fim do processamento (ou cancele) para alterar as ligações.")
+            return
         self.draft_wire = ConnectionWire(connector, self)
 
     def mouseMoveEvent(self, event):
@@ -527,7 +750,9 @@ class FlowScene(QGraphicsScene):
     def mouseReleaseEvent(self, event):
         if self.draft_wire:
             item = self.itemAt(event.scenePos(), QTransform())
-            if isinstance(item, NodeConnector):
+            if self.locked: # arrasto começado antes da execução: a ligação não pode mudar com o worker rodando
+                print("Aguarde o fim do processamento (ou cancele) para alterar as ligações.")
+            elif isinstance(item, NodeConnector):
                 if self.is_valid_connection(self.draft_wire.start_conn, item):
                     self.draft_wire.set_end_connector(item)
                     self.draft_wire = None
@@ -585,6 +810,10 @@ class FlowScene(QGraphicsScene):
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Delete or event.key() == Qt.Key.Key_Backspace:
+            if self.locked:
+                print("Aguarde o fim do processamento (ou cancele) para remover blocos ou ligações.")
+                event.accept()
+                return
             selected_items = self.selectedItems()
             for item in selected_items:
                 if isinstance(item, NodeBlock):
@@ -639,7 +868,91 @@ class FlowView(QGraphicsView):
     def on_context_menu_triggered(self, block_name):
         self.scene().create_block(block_name, self._context_menu_pos)
 
-# --- 7. CLASSE MainWindow ---
+class SaveSignals(QObject):
+    """ Sinais da gravação em segundo plano. """
+    finished = Signal(object)
+    failed = Signal(object, str)
+
+def run_snapshot(snapshot):
+    """ Executa o retrato (nós, nó alvo, imagens de entrada) tirado por MainWindow.full_resolution_snapshot
+    e retorna a saída do nó alvo. Não usa nada da cena, então pode rodar fora da thread da interface. """
+    nodes, target, inputs = snapshot
+    pipeline.run_workflow(nodes, inputs=inputs)
+    return target.output_data
+
+class SaveWorker(QRunnable):
+    """ Grava o arquivo de um bloco de Gravação RAW sem travar a interface. Com 'snapshot', o resultado em
+    resolução total é calculado aqui mesmo (run_snapshot) antes da gravação. Dados e codec são os do momento
+    do clique: o worker não lê o bloco, que uma nova execução do fluxo (ex.: modo ao vivo) pode alterar. """
+    def __init__(self, block, path, data=None, provenance=None, snapshot=None, codec=None):
+        super().__init__()
+        self.block = block
+        self.path = path
+        self.data = data
+        self.provenance = provenance
+        self.snapshot = snapshot
+        self.codec = codec
+        self.signals = SaveSignals()
+
+    def run(self):
+        try:
+            data = run_snapshot(self.snapshot) if self.snapshot is not None else self.data
+            self.block.save_to_file(self.path, data, self.provenance, self.codec)
+        except Exception as e:
+            self.signals.failed.emit(self, str(e))
+        else:
+            self.signals.finished.emit(self)
+
+# --- 7. CLASSE FlowWorker ---
+class FlowSignals(QObject):
+    """ Sinais da execução em segundo plano (entregues na thread da interface). """
+    block_started = Signal(object)
+    block_finished = Signal(object)
+    block_failed = Signal(object, str)
+    finished = Signal(bool) # True se a execução foi cancelada
+
+class FlowWorker(QRunnable):
+    """ Executa os blocos do fluxo fora da thread da interface, que continua respondendo. """
+    def __init__(self, blocks, cache, profiler=None):
+        super().__init__()
+        self.blocks = blocks
+        self.cache = cache
+        self.profiler = profiler
+        self.cancel_event = threading.Event()
+        self.signals = FlowSignals()
+
+    def cancel(self):
+        """ Pede o cancelamento; os filtros param na próxima faixa/tile. """
+        self.cancel_event.set()
+
+    def run_block(self, block):
+        pu.check_cancelled()
+        self.signals.block_started.emit(block)
+        try:
+            block.execute(self.cache, self.profiler)
+        except pu.Cancelled:
+            raise
+        except Exception as e:
+            # O erro fica no bloco; os blocos abaixo recebem entrada vazia
+            block.output_data = None
+            self.signals.block_failed.emit(block, str(e))
+
+    def run(self):
+        pu.set_cancel_event(self.cancel_event)
+        cancelled = False
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            flow_graph.run_parallel(self.blocks, self.run_block, self.signals.block_finished.emit,
+                                    max_workers=FLOW_WORKERS)
+        except pu.Cancelled:
+            cancelled = True
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+        self.signals.finished.emit(cancelled)
+
+# --- 8. CLASSE MainWindow ---
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -652,11 +965,56 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.view)
         
         self.error_dialog = QErrorMessage(self)
+        self.result_cache = result_cache.ResultCache()
+        self.flow_worker = None # execução em segundo plano atual
+        self.save_workers = set() # gravações em andamento (mantém os sinais vivos até terminarem)
+        self.flow_blocks = []
+        self.cycle_error = None
+        self.last_profile = None # relatório de tempos da última execução (profiling.RunProfiler)
+        self.preview_mode = False # fluxo roda sobre uma versão reduzida das imagens de entrada
+        self.live_mode = False # edições de parâmetros reprocessam o fluxo sozinhas
+        self.pending_updates = {} # bloco -> parâmetros editados durante uma execução (aplicados no fim dela)
+        self.pending_actions = [] # outras alterações feitas durante uma execução (run_when_idle)
+        self.flow_generations = {} # bloco -> dirty_generation quando a execução atual começou
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(LIVE_DEBOUNCE_MS)
+        self.live_timer.timeout.connect(self.run_live)
         
         toolbar = self.addToolBar("Execução")
         self.process_button = QPushButton("Processar Fluxo")
         self.process_button.clicked.connect(self.process_flow)
         toolbar.addWidget(self.process_button)
+        self.cancel_button = QPushButton("Cancelar")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_flow)
+        toolbar.addWidget(self.cancel_button)
+        self.preview_button = QPushButton("Prévia Rápida")
+        self.preview_button.setCheckable(True)
+        self.preview_button.toggled.connect(self.set_preview_mode)
+        toolbar.addWidget(self.preview_button)
+        self.live_button = QPushButton("Ao Vivo")
+        self.live_button.setCheckable(True)
+        self.live_button.toggled.connect(self.set_live_mode)
+        toolbar.addWidget(self.live_button)
+        toolbar.addSeparator()
+        save_flow_button = QPushButton("Salvar Fluxo")
+        save_flow_button.clicked.connect(self.save_workflow)
+        toolbar.addWidget(save_flow_button)
+        open_flow_button = QPushButton("Abrir Fluxo")
+        open_flow_button.clicked.connect(self.open_workflow)
+        toolbar.addWidget(open_flow_button)
+        plan_button = QPushButton("Ver Plano")
+        plan_button.clicked.connect(self.show_plan)
+        toolbar.addWidget(plan_button)
+        self.memory_button = QPushButton("Medir Memória")
+        self.memory_button.setCheckable(True)
+        self.memory_button.setChecked(PROFILE_MEMORY)
+        self.memory_button.setToolTip("Inclui a memória de pico de cada bloco no relatório (execução mais lenta)")
+        toolbar.addWidget(self.memory_button)
+        report_button = QPushButton("Exportar Tempos")
+        report_button.clicked.connect(self.export_profile)
+        toolbar.addWidget(report_button)
         
         self.create_properties_dock() 
         
@@ -810,18 +1168,55 @@ class MainWindow(QMainWindow):
             self.width_spin.blockSignals(False)
             self.height_spin.blockSignals(False)
             
-            block.parameters["width"] = w
-            block.parameters["height"] = h
-            
-            if block.output_data is not None:
-                try:
-                    flat_data = block.output_data.flatten()
-                    block.output_data = flat_data.reshape((h, w))
-                    print(f"Dados do bloco reformatados em memória para {w}x{h}")
-                except ValueError as e:
-                    print(f"Erro ao reformatar imagem: {e}")
+            def apply():
+                block.parameters["width"] = w
+                block.parameters["height"] = h
+                
+                if block.image_data is not None:
+                    try:
+                        # Visão com a nova forma sobre os mesmos pixels (memmap ou array), sem cópia
+                        block.image_data = pu.reshape_view(block.image_data, (h, w))
+                        block.mark_dirty()
+                        print(f"Dados do bloco reformatados para {w}x{h} (sem cópia)")
+                    except ValueError as e:
+                        print(f"Erro ao reformatar imagem: {e}")
+            self.run_when_idle(apply)
+
+    def run_when_idle(self, action):
+        """ Executa 'action' agora ou, se o fluxo estiver rodando (o worker lê os dados dos blocos), no fim da execução. """
+        if self.flow_worker is None:
+            action()
+        else:
+            self.pending_actions.append(action)
+            print("Alteração será aplicada ao fim do processamento atual.")
+
+    def flow_busy(self, what):
+        """ True (com aviso) se há uma execução em andamento; usado por ações que trocam dados ou a estrutura do fluxo. """
+        if self.flow_worker is None:
+            return False
+        self.error_dialog.showMessage(f"Aguarde o fim do processamento (ou cancele) para {what}.")
+        return True
     
+    def set_native_image(self, block, filepath, img_data, origin):
+        """ Define a imagem do bloco quando largura e altura já são conhecidas (JPG/PNG ou RAW com cabeçalho). """
+        h, w = img_data.shape
+        block.image_data = img_data
+        block.parameters["filepath"] = filepath
+        block.parameters["width"] = w
+        block.parameters["height"] = h
+        
+        # Atualiza UI
+        self.width_spin.setValue(w)
+        self.height_spin.setValue(h)
+        self.filepath_label.setText(filepath)
+        self.res_combo.clear()
+        self.res_combo.addItem(f"{w} x {h} ({origin})", (w, h))
+        block.mark_dirty()
+        print(f"Sucesso: Imagem carregada ({w}x{h})")
+
     def load_raw_file(self, block):
+        if self.flow_busy("carregar outro arquivo"):
+            return
         # Descobre qual modo o usuário quer usar
         mode_index = self.format_combo.currentIndex()
         
@@ -831,7 +1226,7 @@ class MainWindow(QMainWindow):
         elif mode_index == 1: # Texto
             filter_str = "Text/RAW (*.txt *.raw);;All Files (*)"
         else: # RAW Binário
-            filter_str = "RAW Files (*.raw);;All Files (*)"
+            filter_str = "RAW Files (*.raw *.praw *.craw);;All Files (*)"
 
         filepath, _ = QFileDialog.getOpenFileName(self, "Abrir Arquivo", "", filter_str)
         if not filepath:
@@ -842,25 +1237,19 @@ class MainWindow(QMainWindow):
             
             # --- CASO A: RAW Binário Padrão ---
             if mode_index == 0:
-                img_data = np.fromfile(filepath, dtype=np.uint8)
-                print("Modo: Leitura Binária Direta")
+                if pipeline.has_header(filepath):
+                    # RAW com cabeçalho: dimensões e tipo vêm do arquivo, sem adivinhar
+                    print("Modo: RAW com cabeçalho")
+                    self.set_native_image(block, filepath, pipeline.load_container_image(filepath), "Cabeçalho")
+                    return
+                # Mapeado em memória, somente leitura: abre na hora e só lê do disco o que for usado
+                img_data = pu.map_raw_file(filepath)
+                print("Modo: Leitura Binária Direta (mapeada em memória)")
 
             # --- CASO B: Texto/ASCII (circulo.raw) ---
             elif mode_index == 1:
                 print("Modo: Conversão Texto -> Binário")
-                with open(filepath, 'r') as f:
-                    content = f.read()
-                
-                numeros_texto = content.replace('', '').split()
-                
-                pixels = []
-                for x in numeros_texto:
-                    # Filtra apenas o que parece número
-                    clean_x = x.replace('.', '', 1) 
-                    if clean_x.isdigit() or (clean_x.startswith('-') and clean_x[1:].isdigit()):
-                        pixels.append(int(float(x)))
-                
-                img_data = np.array(pixels, dtype=np.uint8)
+                img_data = raw_text.read_text_pixels(filepath) # lido em pedaços, sem laço por número
 
             # --- CASO C: Imagem JPG/PNG (Pillow) ---
             elif mode_index == 2:
@@ -868,22 +1257,8 @@ class MainWindow(QMainWindow):
                 pil_img = Image.open(filepath).convert('L') # Converte para Escala de Cinza
                 img_data = np.array(pil_img, dtype=np.uint8)
                 
-                # Imagens JPG/PNG já têm largura e altura definidas
-                h, w = img_data.shape
-                
-                # Pula a lógica de fatoração e vai direto para o set
-                block.output_data = img_data
-                block.parameters["filepath"] = filepath
-                block.parameters["width"] = w
-                block.parameters["height"] = h
-                
-                # Atualiza UI
-                self.width_spin.setValue(w)
-                self.height_spin.setValue(h)
-                self.filepath_label.setText(filepath)
-                self.res_combo.clear()
-                self.res_combo.addItem(f"{w} x {h} (Nativo)", (w, h))
-                print(f"Sucesso: Imagem carregada ({w}x{h})")
+                # Imagens JPG/PNG já têm largura e altura definidas: pula a lógica de fatoração
+                self.set_native_image(block, filepath, img_data, "Nativo")
                 return
 
             # --- Lógica Comum para RAW e Texto (Adivinhar Resolução) ---
@@ -891,31 +1266,17 @@ class MainWindow(QMainWindow):
             if img_data is not None:
                 file_size = img_data.size
                 
-                possible_res = []
-                # Tenta fatorar
-                limit = int(math.sqrt(file_size)) + 1
-                for w in range(1, limit):
-                    if file_size % w == 0:
-                        h = file_size // w
-                        possible_res.append((w, h))
-                        if w != h:
-                            possible_res.append((h, w))
-                
-                possible_res.sort(key=lambda x: x[0])
+                # Candidatos do mais provável (linhas vizinhas mais parecidas) para o menos provável
+                possible_res = [(w, h) for w, h, _ in resolution.rank_resolutions(img_data)]
                 
                 # Atualiza Combo Box
                 self.res_combo.blockSignals(True)
                 self.res_combo.clear()
                 
                 best_index = 0
-                min_diff = float('inf')
-                
                 for i, (w, h) in enumerate(possible_res):
-                    self.res_combo.addItem(f"{w} x {h}", (w, h))
-                    diff = abs(w - h)
-                    if diff < min_diff:
-                        min_diff = diff
-                        best_index = i
+                    label = f"{w} x {h} (provável)" if i == best_index else f"{w} x {h}"
+                    self.res_combo.addItem(label, (w, h))
 
                 self.res_combo.setCurrentIndex(best_index)
                 self.res_combo.blockSignals(False)
@@ -923,18 +1284,19 @@ class MainWindow(QMainWindow):
                 # Configura dados iniciais com a melhor aposta
                 if possible_res:
                     w_best, h_best = possible_res[best_index]
-                    block.output_data = img_data.reshape((h_best, w_best))
+                    block.image_data = pu.reshape_view(img_data, (h_best, w_best))
                     block.parameters["width"] = w_best
                     block.parameters["height"] = h_best
                     # Atualiza spinners via callback simulado
                     self.on_resolution_combo_changed(best_index, block)
                 else:
                     # Fallback se não achar fatores
-                    block.output_data = img_data.reshape((1, file_size))
+                    block.image_data = pu.reshape_view(img_data, (1, file_size))
                     print("Aviso: Não foi possível determinar dimensões retangulares.")
 
                 block.parameters["filepath"] = filepath
                 self.filepath_label.setText(filepath)
+                block.mark_dirty()
                 print(f"Sucesso: Dados carregados.")
 
         except Exception as e:
@@ -945,7 +1307,12 @@ class MainWindow(QMainWindow):
     def build_raw_saver_properties(self, block):
         self.props_layout.addWidget(QLabel("Gravação de Arquivo RAW"))
         
-        if block.data_to_save is not None:
+        if block.data_to_save is not None and block.scale > 1:
+            h, w = block.data_to_save.shape
+            status_text = f"Status: Prévia ({w}x{h}); o arquivo é gravado em resolução total"
+            status_style = "color: green; font-weight: bold;"
+            enable_btn = True
+        elif block.data_to_save is not None:
             h, w = block.data_to_save.shape
             status_text = f"Status: Dados prontos ({w}x{h})"
             status_style = "color: green; font-weight: bold;"
@@ -961,6 +1328,17 @@ class MainWindow(QMainWindow):
         
         self.props_layout.addSpacing(10)
         
+        # Compressão usada quando o arquivo é salvo em blocos (.craw)
+        codec_form = QFormLayout()
+        codec_combo = QComboBox()
+        for label, codec in [("zlib (rápido)", "zlib"), ("lzma (menor)", "lzma"), ("Sem compressão", "none")]:
+            codec_combo.addItem(label, codec)
+        codec_combo.setCurrentIndex(max(0, codec_combo.findData(block.parameters.get("codec", raw_chunked.DEFAULT_CODEC))))
+        codec_combo.currentIndexChanged.connect(
+            lambda i: block.parameters.update(codec=codec_combo.itemData(i)))
+        codec_form.addRow("Compressão (.craw):", codec_combo)
+        self.props_layout.addLayout(codec_form)
+        
         save_btn = QPushButton("Salvar Arquivo (.RAW)")
         save_btn.setEnabled(enable_btn)
         save_btn.setMinimumHeight(40) 
@@ -982,18 +1360,40 @@ class MainWindow(QMainWindow):
         filepath, _ = QFileDialog.getSaveFileName(
             self, 
             "Salvar Arquivo RAW", 
-            "imagem_processada.raw", 
-            "RAW Files (*.raw);;All Files (*)"
+            "imagem_processada.praw", 
+            "RAW com cabeçalho (*.praw);;RAW em blocos comprimidos (*.craw);;RAW puro (*.raw);;All Files (*)"
         )
         
         if not filepath:
             return 
             
         try:
-            block.save_to_file(filepath)
-            print(f"Salvo com sucesso: {filepath}")
+            # Dados e codec de agora: o worker não deve ler o bloco depois (outra execução pode mudá-los)
+            data, snapshot = block.data_to_save, None
+            codec = block.parameters.get("codec", raw_chunked.DEFAULT_CODEC)
+            if block.scale > 1: # o fluxo rodou em prévia: o resultado em resolução total é calculado no worker
+                print("Calculando resultado em resolução total...")
+                snapshot = self.full_resolution_snapshot(block)
+            provenance = raw_container.make_provenance(
+                block=block.title, workflow=pipeline.workflow_to_dict(self.workflow_nodes()))
         except Exception as e:
             self.error_dialog.showMessage(f"Erro ao salvar: {e}")
+            return
+        # O cálculo em resolução total, a gravação e a compressão dos tiles (.craw) rodam fora da thread da interface
+        worker = SaveWorker(block, filepath, data, provenance, snapshot, codec)
+        worker.signals.finished.connect(self.on_save_finished)
+        worker.signals.failed.connect(self.on_save_failed)
+        self.save_workers.add(worker)
+        print(f"Gravando {filepath} em segundo plano...")
+        QThreadPool.globalInstance().start(worker)
+
+    def on_save_finished(self, worker):
+        self.save_workers.discard(worker)
+        print(f"Salvo com sucesso: {worker.path} ({os.path.getsize(worker.path)} bytes)")
+
+    def on_save_failed(self, worker, message):
+        self.save_workers.discard(worker)
+        self.error_dialog.showMessage(f"Erro ao salvar: {message}")
 
     # --- Processamento Pontual ---
     def build_punctual_properties(self, block):
@@ -1003,7 +1403,7 @@ class MainWindow(QMainWindow):
         form_layout.setFormAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop)
         
         op_combo = QComboBox()
-        op_combo.addItems(["Brilho", "Limiar"])
+        op_combo.addItems(["Brilho", "Limiar", "Negativo", "Gama", "Contraste"])
         op_combo.setCurrentText(block.parameters.get("operation", "Brilho"))
         form_layout.addRow("Operação:", op_combo)
 
@@ -1017,13 +1417,47 @@ class MainWindow(QMainWindow):
         threshold_spin.setValue(int(block.parameters.get("threshold", 128)))
         form_layout.addRow("Limiar (T):", threshold_spin)
 
+        gamma_spin = QDoubleSpinBox()
+        gamma_spin.setRange(0.05, 10.0)
+        gamma_spin.setSingleStep(0.1)
+        gamma_spin.setValue(float(block.parameters.get("gamma", 1.0)))
+        form_layout.addRow("Gama:", gamma_spin)
+
+        low_spin = QSpinBox()
+        low_spin.setRange(0, 255)
+        low_spin.setValue(int(block.parameters.get("stretch_low", 0)))
+        form_layout.addRow("Contraste (mínimo):", low_spin)
+
+        high_spin = QSpinBox()
+        high_spin.setRange(0, 255)
+        high_spin.setValue(int(block.parameters.get("stretch_high", 255)))
+        form_layout.addRow("Contraste (máximo):", high_spin)
+
         self.props_layout.addLayout(form_layout)
 
+        def read_params():
+            return {
+                "operation": op_combo.currentText(),
+                "brightness": int(brightness_spin.value()),
+                "threshold": int(threshold_spin.value()),
+                "gamma": float(gamma_spin.value()),
+                "stretch_low": int(low_spin.value()),
+                "stretch_high": int(high_spin.value()),
+            }
+
         def apply_params():
-            block.parameters["operation"] = op_combo.currentText()
-            block.parameters["brightness"] = int(brightness_spin.value())
-            block.parameters["threshold"] = int(threshold_spin.value())
-            print(f"Parâmetros do '{block.title}' atualizados: {block.parameters}")
+            self.update_block_parameters(block, read_params())
+
+        def live_edit(*_):
+            if self.live_mode:
+                self.update_block_parameters(block, read_params(), live=True)
+
+        op_combo.currentTextChanged.connect(live_edit)
+        brightness_spin.valueChanged.connect(live_edit)
+        threshold_spin.valueChanged.connect(live_edit)
+        gamma_spin.valueChanged.connect(live_edit)
+        low_spin.valueChanged.connect(live_edit)
+        high_spin.valueChanged.connect(live_edit)
 
         apply_btn = QPushButton("Aplicar parâmetros")
         apply_btn.clicked.connect(apply_params)
@@ -1053,11 +1487,24 @@ class MainWindow(QMainWindow):
 
         self.props_layout.addLayout(form_layout)
 
+        def read_conv_params():
+            return {
+                "preset": preset_combo.currentText(),
+                "median_size": int(median_spin.value()),
+                "kernel_text": kernel_text.toPlainText(),
+            }
+
         def apply_conv_params():
-            block.parameters["preset"] = preset_combo.currentText()
-            block.parameters["median_size"] = int(median_spin.value())
-            block.parameters["kernel_text"] = kernel_text.toPlainText()
-            print(f"Parâmetros de convolução atualizados: {block.parameters}")
+            self.update_block_parameters(block, read_conv_params())
+
+        def live_edit(*_):
+            if self.live_mode:
+                self.update_block_parameters(block, read_conv_params(), live=True)
+
+        preset_combo.currentTextChanged.connect(live_edit)
+        median_spin.valueChanged.connect(live_edit)
+        kernel_text.textChanged.connect(live_edit)
+
         apply_btn = QPushButton("Aplicar parâmetros")
         apply_btn.clicked.connect(apply_conv_params)
         self.props_layout.addWidget(apply_btn)
@@ -1128,6 +1575,160 @@ class MainWindow(QMainWindow):
         show_metrics_btn.clicked.connect(show_metrics)
         self.props_layout.addWidget(show_metrics_btn)
 
+    # --- Arquivo de fluxo (JSON) ---
+    def workflow_nodes(self):
+        """ Converte os blocos da cena em nós do pipeline (sem Qt), para salvar ou executar fora da interface. """
+        return list(self.workflow_node_map().values())
+
+    def workflow_node_map(self):
+        """ {bloco: nó do pipeline} com as ligações entre os nós já feitas. """
+        blocks = [item for item in self.scene.items() if isinstance(item, NodeBlock)]
+        blocks.sort(key=lambda b: (b.pos().x(), b.pos().y()))
+        nodes = {}
+        for i, block in enumerate(blocks):
+            params = {k: v for k, v in block.parameters.items() if k not in block.transient_parameters}
+            nodes[block] = pipeline.Node(i, block.title, params, (block.pos().x(), block.pos().y()))
+        for block, node in nodes.items():
+            for i in range(len(block.inputs)):
+                src = block.input_block(i)
+                if src in nodes:
+                    node.input_connections[i] = nodes[src]
+        return nodes
+
+    def full_resolution_snapshot(self, block):
+        """ Retrato, tirado na thread da interface, do que é preciso para calcular 'block' em resolução total
+        e sem Qt: (nós de que ele depende, nó do bloco, {nó de leitura: imagem}). Os nós são cópias dos
+        blocos, então o retrato não muda se o fluxo for editado depois; roda com run_snapshot. """
+        nodes = self.workflow_node_map()
+        target = nodes[block]
+        needed = []
+        stack = [target]
+        while stack:
+            node = stack.pop()
+            if node not in needed:
+                needed.append(node)
+                stack.extend(node.input_connections.values())
+        inputs = {node: b.image_data for b, node in nodes.items() if isinstance(b, BlockRawInput)}
+        return needed, target, inputs
+
+    def save_workflow(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, "Salvar Fluxo", "fluxo.json", "Fluxo (*.json);;All Files (*)")
+        if not filepath:
+            return
+        try:
+            pipeline.save_workflow(filepath, self.workflow_nodes())
+            print(f"Fluxo salvo em: {filepath}")
+        except Exception as e:
+            self.error_dialog.showMessage(f"Erro ao salvar fluxo: {e}")
+
+    def open_workflow(self):
+        if self.flow_busy("abrir outro fluxo"):
+            return
+        filepath, _ = QFileDialog.getOpenFileName(self, "Abrir Fluxo", "", "Fluxo (*.json);;All Files (*)")
+        if not filepath:
+            return
+        try:
+            self.load_workflow_nodes(pipeline.load_workflow(filepath))
+            print(f"Fluxo carregado de: {filepath}")
+        except Exception as e:
+            self.error_dialog.showMessage(f"Erro ao abrir fluxo: {e}")
+
+    def show_plan(self):
+        """ Mostra o plano compilado do fluxo (fusões e blocos removidos), como é executado em lote. """
+        try:
+            plan = pipeline.compile_workflow(self.workflow_nodes())
+        except flow_graph.CycleError as e:
+            self.error_dialog.showMessage(str(e))
+            return
+        dlg = QDialog(self)
+        dlg.setWindowTitle("Plano de Execução")
+        layout = QVBoxLayout(dlg)
+        text = QTextEdit()
+        text.setReadOnly(True)
+        text.setPlainText(plan.describe())
+        layout.addWidget(text)
+        dlg.resize(600, 300)
+        dlg.exec()
+
+    def export_profile(self):
+        """ Salva o relatório de tempos da última execução (JSON, CSV ou trace do Chrome). """
+        if self.last_profile is None or not self.last_profile.records:
+            self.error_dialog.showMessage("Sem medições (execute 'Processar Fluxo' antes).")
+            return
+        filters = "JSON (*.json);;CSV (*.csv);;Chrome Trace (*.trace.json)"
+        filepath, selected = QFileDialog.getSaveFileName(self, "Exportar Tempos", "tempos.json", filters)
+        if not filepath:
+            return
+        try:
+            if selected.startswith("Chrome") or filepath.endswith(".trace.json"):
+                self.last_profile.save_chrome_trace(filepath)
+            elif selected.startswith("CSV") or filepath.lower().endswith(".csv"):
+                self.last_profile.save_csv(filepath)
+            else:
+                self.last_profile.save_json(filepath)
+            print(f"Relatório de tempos salvo em: {filepath}")
+        except Exception as e:
+            self.error_dialog.showMessage(f"Erro ao exportar tempos: {e}")
+
+    def load_workflow_nodes(self, nodes):
+        """ Substitui a cena pelos blocos e ligações do fluxo. """
+        for item in list(self.scene.items()):
+            if isinstance(item, NodeBlock):
+                self.scene.delete_block(item)
+        blocks = {}
+        for node in nodes:
+            block = self.scene.create_block(node.type, QPointF(*node.pos))
+            block.parameters.update(node.parameters)
+            blocks[node] = block
+        for node, block in blocks.items():
+            for i, src in node.input_connections.items():
+                wire = ConnectionWire(blocks[src].outputs[0][0], self.scene)
+                wire.set_end_connector(block.inputs[i][0])
+        for node, block in blocks.items():
+            filepath = node.parameters.get("filepath")
+            if node.type == pipeline.RAW_INPUT and filepath:
+                try:
+                    block.image_data = pipeline.load_input(filepath, node.parameters)
+                except Exception as e:
+                    print(f"Não foi possível recarregar {filepath}: {e}")
+
+    def set_preview_mode(self, enabled):
+        """ Liga/desliga a prévia: as entradas maiores que PREVIEW_MAX_SIDE são reduzidas no próximo processamento. """
+        self.preview_mode = enabled
+        print("Prévia rápida " + ("ligada" if enabled else "desligada (resolução total)") + ".")
+
+    def set_live_mode(self, enabled):
+        """ Modo ao vivo: cada edição nos parâmetros reprocessa (com atraso) só os blocos afetados. """
+        self.live_mode = enabled
+        print("Modo ao vivo " + ("ligado." if enabled else "desligado."))
+        if enabled:
+            self.live_timer.start()
+
+    def update_block_parameters(self, block, updates, live=False):
+        """ Aplica parâmetros editados e marca o bloco (e o que vem abaixo) para reprocessar.
+        Durante uma execução os parâmetros não mudam: a edição fica guardada até ela terminar e,
+        no modo ao vivo, a execução em andamento (já desatualizada) é cancelada. """
+        if self.flow_worker is not None:
+            self.pending_updates.setdefault(block, {}).update(updates)
+            if live:
+                self.flow_worker.cancel()
+            else:
+                print(f"Parâmetros do '{block.title}' serão aplicados ao fim do processamento atual.")
+        else:
+            block.parameters.update(updates)
+            block.mark_dirty()
+            if not live:
+                print(f"Parâmetros do '{block.title}' atualizados: {block.parameters}")
+        if live:
+            self.live_timer.start() # reinicia a espera a cada edição (debounce)
+
+    def run_live(self):
+        if not self.live_mode:
+            return
+        if self.flow_worker is not None:
+            return # on_flow_finished reagenda depois de aplicar as edições pendentes
+        self.process_flow()
+
     def process_flow(self):
         print("\n--- INICIANDO PROCESSAMENTO DO FLUXO ---")
         
@@ -1137,37 +1738,114 @@ class MainWindow(QMainWindow):
         if not root_nodes:
             print("Processamento falhou: Nenhum nó inicial (como Leitura RAW) encontrado.")
             return
-            
-        queue = list(root_nodes)
-        processed = set()
-        
-        max_iterations = len(all_blocks) * 4
-        count = 0
-        
-        while queue and count < max_iterations:
-            block = queue.pop(0)
-            count += 1
-            
-            if block in processed:
-                continue
-                
-            dependencies = block.input_connections.values()
-            
-            if all(dep in processed for dep in dependencies):
-                block.process()
-                processed.add(block)
-                
-                for conn, _ in block.outputs:
-                    for wire in conn.wires:
-                        next_block = wire.end_conn.parent_block
-                        if next_block not in processed:
-                            queue.append(next_block)
-            else:
-                queue.append(block)
-                
-        if count >= max_iterations and queue:
-            print("Erro de processamento: Possível loop ou dependência circular detectada.")
-        print("--- PROCESSAMENTO DO FLUXO CONCLUÍDO ---")
+
+        if self.flow_worker is not None:
+            print("Já existe um processamento em andamento.")
+            return
+
+        # Entradas cuja resolução mudou (prévia ligada/desligada) precisam ser reprocessadas
+        max_side = PREVIEW_MAX_SIDE if self.preview_mode else None
+        for block in all_blocks:
+            if isinstance(block, BlockRawInput) and block.preview_max_side != max_side:
+                block.preview_max_side = max_side
+                block.mark_dirty()
+
+        self.cycle_error = None
+        try:
+            order = flow_graph.topological_order(all_blocks)
+        except flow_graph.CycleError as e:
+            # Executa o que não depende do ciclo e depois destaca os blocos do ciclo
+            self.cycle_error = e
+            order = e.order
+            print(f"Erro de processamento: {e}")
+
+        # Só os blocos marcados (parâmetros, arquivo ou ligações alterados) e o que vem abaixo deles
+        dirty_blocks = [b for b in order if b.dirty]
+        if not dirty_blocks:
+            print("Nenhum bloco alterado desde o último processamento.")
+        for block in dirty_blocks:
+            block.set_run_state("pending")
+
+        # A execução roda em segundo plano; os sinais chegam na thread da interface.
+        # Sem blocos a executar, o relatório de tempos da execução anterior continua valendo.
+        profiler = None
+        if dirty_blocks:
+            profiler = profiling.RunProfiler(track_memory=self.memory_button.isChecked())
+            self.last_profile = profiler
+        worker = FlowWorker(dirty_blocks, self.result_cache, profiler)
+        worker.signals.block_started.connect(self.on_block_started)
+        worker.signals.block_failed.connect(self.on_block_failed)
+        worker.signals.block_finished.connect(self.on_block_finished)
+        worker.signals.finished.connect(self.on_flow_finished)
+        self.flow_worker = worker
+        self.flow_blocks = dirty_blocks
+        self.flow_generations = {block: block.dirty_generation for block in dirty_blocks}
+        self.scene.locked = True
+        self.process_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        QThreadPool.globalInstance().start(worker)
+
+    def cancel_flow(self):
+        if self.flow_worker is not None:
+            print("Cancelando processamento...")
+            self.flow_worker.cancel()
+
+    def on_block_started(self, block):
+        block.set_run_state("running")
+
+    def on_block_failed(self, block, message):
+        block.set_run_state("error")
+        print(f"Erro em {block.title}: {message}")
+
+    def on_block_finished(self, block):
+        block.finish() # pixmaps e redesenho na thread da interface
+        if block.run_state != "error":
+            block.set_run_state("done")
+            # Marcado de novo durante a execução (ex.: imagem trocada): o resultado já é antigo, continua sujo
+            if block.dirty_generation == self.flow_generations.get(block):
+                block.dirty = False
+
+    def on_flow_finished(self, cancelled):
+        ran_blocks = bool(self.flow_blocks)
+        for block in self.flow_blocks:
+            if block.run_state in ("pending", "running"):
+                block.set_run_state("cancelled") # continua sujo: roda de novo no próximo processamento
+        self.flow_worker = None
+        self.flow_blocks = []
+        self.flow_generations = {}
+        self.scene.locked = False
+        self.process_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+        # Edições feitas durante a execução
+        pending = self.pending_updates
+        self.pending_updates = {}
+        for block, updates in pending.items():
+            block.parameters.update(updates)
+            block.mark_dirty()
+        actions = self.pending_actions
+        self.pending_actions = []
+        for action in actions:
+            action()
+        if pending and self.live_mode:
+            self.live_timer.start()
+
+        if self.cycle_error is not None:
+            self.scene.clearSelection()
+            for block in self.cycle_error.cycle:
+                block.setSelected(True)
+            self.error_dialog.showMessage(str(self.cycle_error))
+        if ran_blocks and self.last_profile is not None and self.last_profile.records:
+            print("Tempos (mais lentos primeiro):")
+            for line in self.last_profile.summary(top=5):
+                print(f"  {line}")
+        stats = self.result_cache.stats()
+        print(f"Cache: {stats['hits']} acertos, {stats['misses']} falhas, "
+              f"{stats['bytes'] / 2**20:.1f}/{stats['max_bytes'] / 2**20:.0f} MB")
+        if cancelled:
+            print("--- PROCESSAMENTO DO FLUXO CANCELADO ---")
+        else:
+            print("--- PROCESSAMENTO DO FLUXO CONCLUÍDO ---")
         
         self.scene.update() 
 
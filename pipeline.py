@@ -0,0 +1,509 @@
+# pipeline.py
+# Núcleo de execução do fluxo sem Qt: formato de arquivo do fluxo (JSON), operações de cada tipo
+# de bloco e um executor em lote por linha de comando.
+#
+# Uso:
+#   python pipeline.py fluxo.json pasta_entrada pasta_saida [--workers N] [--out-of-core]
+import os
+import sys
+import json
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import processing_utils as pu
+import flow_graph
+import raw_text
+import raw_container
+import raw_chunked
+import resolution
+
+WORKFLOW_VERSION = 1
+
+# Tipos de bloco (os mesmos nomes do menu de contexto da interface)
+RAW_INPUT = "Leitura de arquivo RAW"
+DISPLAY = "Exibição de imagem"
+RAW_OUTPUT = "Gravação de arquivo RAW"
+PUNCTUAL = "Processamento Pontual"
+CONVOLUTION = "Máscara de Convolução"
+HISTOGRAM = "Plotagem de Histograma"
+DIFFERENCE = "Diferença entre Imagens"
+
+BLOCK_TYPES = [RAW_INPUT, DISPLAY, RAW_OUTPUT, PUNCTUAL, CONVOLUTION, HISTOGRAM, DIFFERENCE]
+
+# Número de entradas de cada tipo de bloco
+BLOCK_INPUTS = {
+    RAW_INPUT: 0, DISPLAY: 1, RAW_OUTPUT: 1, PUNCTUAL: 1,
+    CONVOLUTION: 1, HISTOGRAM: 1, DIFFERENCE: 2,
+}
+
+# Extensões aceitas pelo executor em lote (.txt só com o bloco de leitura no modo texto: em binário, um
+# arquivo de anotações viraria uma "imagem")
+RAW_EXTENSIONS = (".raw", raw_container.CONTAINER_EXTENSION, raw_chunked.CHUNKED_EXTENSION)
+TEXT_EXTENSIONS = (".txt",)
+# Formatos de gravação do executor em lote: opção --formato -> extensão
+OUTPUT_FORMATS = {"raw": ".raw", "praw": raw_container.CONTAINER_EXTENSION, "craw": raw_chunked.CHUNKED_EXTENSION}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# --- Operações dos blocos (compartilhadas com a interface) ---
+
+def punctual_lut(parameters):
+    """LUT de 256 entradas equivalente à operação pontual configurada."""
+    op = parameters.get("operation", "Brilho")
+    if op == "Brilho":
+        return pu.brightness_lut(int(parameters.get("brightness", 0)))
+    elif op == "Limiar":
+        return pu.threshold_lut(int(parameters.get("threshold", 128)))
+    elif op == "Negativo":
+        return pu.negative_lut()
+    elif op == "Gama":
+        return pu.gamma_lut(float(parameters.get("gamma", 1.0)))
+    elif op == "Contraste":
+        return pu.contrast_stretch_lut(int(parameters.get("stretch_low", 0)),
+                                       int(parameters.get("stretch_high", 255)))
+    return pu.identity_lut()
+
+
+def convolution_op(parameters):
+    """Operação do preset de convolução: ('conv', kernel), ('median', ksize) ou None (imagem sem alteração)."""
+    preset = parameters.get("preset", "Média")
+    if preset == "Média":
+        return ("conv", np.ones((3,3), dtype=np.float64) / 9.0)
+    elif preset == "Laplaciano":
+        return ("conv", np.array([[0,1,0],[1,-4,1],[0,1,0]], dtype=np.float64))
+    elif preset == "Mediana":
+        return ("median", int(parameters.get("median_size", 3)))
+    elif preset == "Personalizado":
+        k = pu.kernel_from_text(parameters.get("kernel_text", ""))
+        return ("conv", k) if k is not None else None
+    return None
+
+
+def apply_convolution(img, parameters):
+    """Aplica o preset do bloco de convolução (Média, Laplaciano, Mediana ou Personalizado)."""
+    op = convolution_op(parameters)
+    if op is None:
+        if parameters.get("preset") == "Personalizado":
+            print("Kernel inválido; passando imagem sem alteração.")
+        return img
+    if op[0] == "median":
+        return pu.median_filter(img, op[1])
+    return pu.convolve2d(img, op[1])
+
+
+def preview_factor(shape, max_side):
+    """Fator inteiro de redução para que o maior lado da prévia fique <= max_side."""
+    return max(1, -(-max(shape) // max_side))
+
+
+def scale_parameters(parameters, factor):
+    """Parâmetros do bloco de convolução para uma prévia reduzida 'factor' vezes: janelas grandes (mediana,
+    kernel personalizado uniforme) encolhem junto com a imagem; Média e Laplaciano 3x3 ficam iguais."""
+    if factor <= 1:
+        return parameters
+    params = dict(parameters)
+    preset = params.get("preset", "Média")
+    if preset == "Mediana":
+        params["median_size"] = max(1, round(int(params.get("median_size", 3)) / factor)) | 1
+    elif preset == "Personalizado":
+        k = pu.kernel_from_text(params.get("kernel_text", ""))
+        if k is not None and k.ndim == 2 and k.shape[0] == k.shape[1] and pu.is_uniform_kernel(k):
+            size = max(1, round(k.shape[0] / factor)) | 1
+            value = float(k.sum()) / (size * size) # mantém a soma do kernel (mesmo ganho)
+            params["kernel_text"] = "\n".join(" ".join([repr(value)] * size) for _ in range(size))
+    return params
+
+
+def load_input(path, parameters):
+    """Lê um arquivo de entrada como imagem 2D uint8, usando formato e dimensões do bloco de leitura."""
+    ext = os.path.splitext(path)[1].lower()
+    fmt = int(parameters.get("format_index", 0))
+    if fmt == 2 or ext in IMAGE_EXTENSIONS:
+        from PIL import Image
+        return np.array(Image.open(path).convert('L'), dtype=np.uint8)
+    if fmt != 1 and has_header(path):
+        return load_container_image(path) # dimensões vêm do cabeçalho
+    if fmt == 1:
+        data = raw_text.read_text_pixels(path)
+    else:
+        data = pu.map_raw_file(path) # memmap: só lê do disco o que for usado
+    w = int(parameters.get("width", 0))
+    h = int(parameters.get("height", 0))
+    if w * h != data.size:
+        w, h = resolution.best_resolution(data) # dimensões do fluxo não servem para este arquivo
+    return pu.reshape_view(data, (h, w))
+
+
+def has_header(path):
+    """O arquivo é um RAW com cabeçalho (.praw) ou em blocos (.craw)? Reconhecido pelo conteúdo."""
+    return raw_container.is_container(path) or raw_chunked.is_chunked(path)
+
+
+def load_container_image(path):
+    """Imagem 2D uint8 de um RAW com cabeçalho (mapeada em memória quando já está em uint8) ou em
+    blocos (os tiles são descomprimidos em paralelo)."""
+    if raw_chunked.is_chunked(path):
+        data = raw_chunked.read_chunked(path)
+    else:
+        data = raw_container.open_container(path)
+    img = pu.ensure_uint8(data)
+    if img.ndim != 2:
+        raise ValueError(f"Esperada imagem 2D, o arquivo tem forma {img.shape}.")
+    return img
+
+
+# --- Formato do arquivo de fluxo ---
+
+class Node:
+    """Bloco do fluxo sem Qt: tipo, parâmetros e ligações de entrada (índice -> Node)."""
+    def __init__(self, node_id, block_type, parameters=None, pos=(0, 0)):
+        self.id = node_id
+        self.type = block_type
+        self.title = block_type
+        self.parameters = dict(parameters or {})
+        self.pos = pos
+        self.input_connections = {} # índice da entrada -> Node de origem
+        self.output_data = None
+        self.result = {} # resultados extras (métricas, histograma, arquivo gravado)
+
+    def input_data(self, index=0):
+        node = self.input_connections.get(index)
+        return node.output_data if node is not None else None
+
+
+def workflow_to_dict(nodes):
+    """Serializa os nós (com posições, parâmetros e ligações) no formato de arquivo do fluxo."""
+    blocks = []
+    connections = []
+    for node in nodes:
+        blocks.append({
+            "id": node.id,
+            "type": node.type,
+            "pos": [float(node.pos[0]), float(node.pos[1])],
+            "parameters": node.parameters,
+        })
+        for index, src in sorted(node.input_connections.items()):
+            connections.append({"from": src.id, "to": node.id, "input": index})
+    return {"version": WORKFLOW_VERSION, "blocks": blocks, "connections": connections}
+
+
+def workflow_from_dict(data):
+    """Reconstrói a lista de nós a partir do formato de arquivo do fluxo."""
+    if data.get("version", WORKFLOW_VERSION) > WORKFLOW_VERSION:
+        raise ValueError(f"Versão de fluxo não suportada: {data.get('version')}")
+    nodes = {}
+    for b in data.get("blocks", []):
+        if b["type"] not in BLOCK_TYPES:
+            raise ValueError(f"Tipo de bloco desconhecido: {b['type']}")
+        nodes[b["id"]] = Node(b["id"], b["type"], b.get("parameters"), tuple(b.get("pos", (0, 0))))
+    for c in data.get("connections", []):
+        nodes[c["to"]].input_connections[int(c.get("input", 0))] = nodes[c["from"]]
+    return list(nodes.values())
+
+
+def save_workflow(path, nodes):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(workflow_to_dict(nodes), f, ensure_ascii=False, indent=2)
+
+
+def load_workflow(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return workflow_from_dict(json.load(f))
+
+
+# --- Execução ---
+
+def run_node(node, output_dir=None, stem="saida", raw_ext=".raw"):
+    """Executa um nó, lendo as saídas dos nós de entrada (já executados).
+    raw_ext escolhe o formato das saídas RAW (.raw puro, .praw com cabeçalho ou .craw em blocos)."""
+    if node.type == RAW_INPUT:
+        if node.output_data is None and node.parameters.get("filepath"):
+            node.output_data = load_input(node.parameters["filepath"], node.parameters)
+    elif node.type == PUNCTUAL:
+        img = node.input_data()
+        node.output_data = pu.apply_lut(img, punctual_lut(node.parameters)) if img is not None else None
+    elif node.type == CONVOLUTION:
+        img = node.input_data()
+        node.output_data = apply_convolution(img, node.parameters) if img is not None else None
+    elif node.type == DIFFERENCE:
+        a, b = node.input_data(0), node.input_data(1)
+        node.output_data, metrics = pu.img_diff(a, b)
+        node.result["metrics"] = metrics
+    elif node.type == HISTOGRAM:
+        img = node.input_data()
+        node.output_data = img
+        if img is not None:
+            node.result["histogram"] = pu.compute_histogram(img, bins=256)[0]
+    elif node.type == RAW_OUTPUT:
+        img = node.input_data()
+        node.output_data = img
+        if img is not None and output_dir is not None:
+            path = os.path.join(output_dir, f"{stem}_{node.id}{raw_ext}")
+            raw_container.save_raw(path, img, raw_container.make_provenance(input=stem, block_id=node.id),
+                                   node.parameters.get("codec", raw_chunked.DEFAULT_CODEC))
+            node.result["file"] = path
+    # Exibição: não há o que fazer sem interface
+
+
+# --- Compilação do fluxo ---
+# Antes da execução sem interface o grafo é reescrito num plano: operações pontuais seguidas viram uma LUT só,
+# blocos que não alteram a imagem são removidos e cadeias de operações em que cada resultado intermediário
+# tem um único consumidor rodam faixa a faixa (pu.apply_chain), sem materializar a imagem inteira entre blocos.
+#
+# Kernels de convolução seguidos não são multiplicados num kernel único: cada bloco trunca e limita o resultado
+# a uint8 (e replica a borda) antes do próximo, então a composição só seria exata com um kernel identidade,
+# caso que já é removido como bloco sem efeito.
+
+# Blocos que repassam a imagem de entrada, mas precisam dela (gravação / histograma)
+PASS_THROUGH_SINKS = (RAW_OUTPUT, HISTOGRAM)
+
+
+def node_op(node):
+    """Operação de imagem de um nó pontual ou de convolução ('lut', 'conv' ou 'median'), ou None se o nó
+    não altera a imagem."""
+    if node.type == PUNCTUAL:
+        lut = punctual_lut(node.parameters)
+        return None if np.array_equal(lut, pu.identity_lut()) else ("lut", lut)
+    if node.type == CONVOLUTION:
+        op = convolution_op(node.parameters)
+        if op is None:
+            return None
+        if op[0] == "median":
+            return op if op[1] > 1 else None
+        return op if not pu.is_identity_kernel(op[1]) else None
+    return None
+
+
+def describe_op(op):
+    kind, arg = op
+    if kind == "conv":
+        return f"conv {arg.shape[0]}x{arg.shape[1]}"
+    if kind == "median":
+        return f"mediana {arg | 1}x{arg | 1}"
+    return "LUT"
+
+
+class PlanStep:
+    """Passo do plano compilado.
+    kind: 'run' (executa o nó como está), 'alias' (nó sem efeito: repassa a imagem de 'source')
+    ou 'fused' (aplica 'ops' à imagem de 'source', cobrindo os nós de 'nodes' de uma vez)."""
+    def __init__(self, kind, node, nodes=None, source=None, ops=None, note=""):
+        self.kind = kind
+        self.node = node # nó cuja saída o passo produz
+        self.nodes = nodes or [node] # nós originais cobertos pelo passo
+        self.source = source
+        self.ops = ops or []
+        self.note = note
+
+
+class Plan:
+    """Plano de execução compilado a partir dos nós do fluxo."""
+    def __init__(self, nodes, steps):
+        self.nodes = nodes
+        self.steps = steps
+
+    def stats(self):
+        fused = [s for s in self.steps if s.kind == "fused"]
+        return {
+            "blocks": len(self.nodes),
+            "steps": len(self.steps),
+            "removed": sum(1 for s in self.steps if s.kind == "alias"),
+            "fused_blocks": sum(len(s.nodes) for s in fused if len(s.nodes) > 1),
+            "intermediates_avoided": sum(len(s.nodes) - 1 for s in fused),
+        }
+
+    def describe(self):
+        """Texto com os passos do plano e as fusões feitas."""
+        lines = []
+        for i, step in enumerate(self.steps, 1):
+            names = " + ".join(f"{n.title} [{n.id}]" for n in step.nodes)
+            if step.kind == "run":
+                lines.append(f"{i}. {names}")
+            elif step.kind == "alias":
+                lines.append(f"{i}. {names}: removido ({step.note})")
+            else:
+                ops = ", ".join(describe_op(op) for op in step.ops)
+                lines.append(f"{i}. {names}: {ops}" + (f" ({step.note})" if step.note else ""))
+        st = self.stats()
+        lines.append(f"{st['blocks']} blocos -> {st['steps']} passos; {st['removed']} removido(s), "
+                     f"{st['fused_blocks']} fundido(s), {st['intermediates_avoided']} imagem(ns) intermediária(s) evitada(s)")
+        return "\n".join(lines)
+
+
+def compile_workflow(nodes):
+    """Reescreve o fluxo num Plan (ver comentário da seção). Lança flow_graph.CycleError se houver ciclo."""
+    order = flow_graph.topological_order(nodes)
+    ops = {node: node_op(node) for node in order}
+    identity = {n for n in order if n.type in (PUNCTUAL, CONVOLUTION) and ops[n] is None}
+
+    def data_source(node):
+        """Nó que de fato produz a imagem vista na saída de 'node' (pula os que só repassam)."""
+        while node is not None and (node in identity or node.type in PASS_THROUGH_SINKS):
+            node = node.input_connections.get(0)
+        return node
+
+    # Quem precisa da imagem produzida por cada nó (através dos nós que só repassam)
+    readers = {n: [] for n in order}
+    for node in order:
+        if node in identity or node.type == DISPLAY: # exibição não faz nada sem interface
+            continue
+        for src in node.input_connections.values():
+            src = data_source(src)
+            if src is not None and node not in readers[src]:
+                readers[src].append(node)
+
+    # Cadeias: um nó de operação entra na cadeia da sua fonte se for o único a ler a imagem dela
+    chain_of = {}
+    for node in order:
+        if ops[node] is None:
+            continue
+        src = data_source(node.input_connections.get(0))
+        if src in chain_of and readers[src] == [node]:
+            chain = chain_of[src]
+            chain.append(node)
+        else:
+            chain = [node]
+        chain_of[node] = chain
+
+    steps = []
+    for node in order:
+        if node in identity:
+            note = "kernel inválido" if convolution_op(node.parameters) is None and node.type == CONVOLUTION \
+                else "operação sem efeito"
+            steps.append(PlanStep("alias", node, source=data_source(node.input_connections.get(0)), note=note))
+        elif node in chain_of:
+            chain = chain_of[node]
+            if chain[0] is not node:
+                continue # o passo sai no primeiro nó (os seguintes só dependem do anterior da cadeia)
+            fused_ops = []
+            for n in chain:
+                op = ops[n]
+                if op[0] == "lut" and fused_ops and fused_ops[-1][0] == "lut": # LUTs seguidas viram uma só
+                    fused_ops[-1] = ("lut", pu.compose_luts(fused_ops[-1][1], op[1]))
+                else:
+                    fused_ops.append(op)
+            note = ""
+            if len(chain) > 1:
+                note = "uma passada em faixas" if len(fused_ops) > 1 else "LUTs compostas"
+            steps.append(PlanStep("fused", chain[-1], chain, data_source(node.input_connections.get(0)),
+                                  fused_ops, note))
+        else:
+            steps.append(PlanStep("run", node))
+    return Plan(list(nodes), steps)
+
+
+def run_plan(plan, output_dir=None, stem="saida", raw_ext=".raw", scratch_dir=None):
+    """Executa os passos de um plano compilado (os nós de entrada já devem ter sua imagem, se for o caso).
+    Com scratch_dir, os passos fundidos cuja imagem de origem está mapeada do disco (np.memmap) rodam fora
+    da memória: leem faixa a faixa da origem e gravam num memmap em scratch_dir, que vira a saída do passo."""
+    for step in plan.steps:
+        if step.kind == "run":
+            run_node(step.node, output_dir, stem, raw_ext)
+        else:
+            img = step.source.output_data if step.source is not None else None
+            if step.kind == "fused" and img is not None:
+                if scratch_dir is not None and isinstance(img, np.memmap):
+                    path = os.path.join(scratch_dir, f"{stem}_{step.node.id}.raw")
+                    img = pu.apply_chain_out_of_core(img, step.ops, path)
+                else:
+                    img = pu.apply_chain(img, step.ops)
+            step.node.output_data = img
+
+
+def run_workflow(nodes, input_image=None, output_dir=None, stem="saida", compile=True, inputs=None,
+                 raw_ext=".raw", scratch_dir=None):
+    """Executa o fluxo (compilado, ou bloco a bloco em ordem topológica com compile=False).
+    input_image (se dada) substitui a imagem dos blocos de leitura; inputs ({nó: imagem}) define a de cada um.
+    scratch_dir ativa a execução fora da memória do plano compilado (ver run_plan)."""
+    inputs = inputs or {}
+    for node in nodes:
+        node.output_data = None
+        node.result = {}
+        if node.type == RAW_INPUT:
+            node.output_data = inputs.get(node, input_image)
+    if compile:
+        run_plan(compile_workflow(nodes), output_dir, stem, raw_ext, scratch_dir)
+    else:
+        for node in flow_graph.topological_order(nodes):
+            run_node(node, output_dir, stem, raw_ext)
+    return nodes
+
+
+def reader_parameters(nodes):
+    """Parâmetros do (primeiro) bloco de leitura do fluxo, usados para ler cada arquivo do lote."""
+    reader = next((n for n in nodes if n.type == RAW_INPUT), None)
+    return reader.parameters if reader is not None else {}
+
+
+def input_extensions(parameters):
+    """Extensões dos arquivos que o lote lê com esses parâmetros de leitura."""
+    text = int(parameters.get("format_index", 0)) == 1
+    return RAW_EXTENSIONS + (TEXT_EXTENSIONS if text else ()) + IMAGE_EXTENSIONS
+
+
+def _run_file(args):
+    """Executa o fluxo para um arquivo de entrada (roda num processo separado)."""
+    workflow_path, input_path, output_dir, raw_ext, out_of_core = args
+    nodes = load_workflow(workflow_path)
+    params = reader_parameters(nodes)
+    img = load_input(input_path, params)
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    summary = {"input": input_path, "shape": list(img.shape)}
+    # Fora da memória: os intermediários ficam em arquivos temporários na pasta de saída
+    scratch = tempfile.TemporaryDirectory(dir=output_dir, prefix=f".{stem}_") if out_of_core else None
+    try:
+        run_workflow(nodes, img, output_dir, stem, raw_ext=raw_ext,
+                     scratch_dir=scratch.name if scratch is not None else None)
+        for node in nodes:
+            if "metrics" in node.result:
+                summary[f"metrics_{node.id}"] = node.result["metrics"]
+            if "file" in node.result:
+                summary.setdefault("outputs", []).append(node.result["file"])
+    finally:
+        for node in nodes:
+            node.output_data = None # solta os memmaps antes de apagar os temporários
+        if scratch is not None:
+            scratch.cleanup()
+    return summary
+
+
+def run_batch(workflow_path, input_dir, output_dir, workers=None, raw_ext=".raw", out_of_core=False):
+    """Executa o fluxo salvo para cada RAW/JPEG da pasta de entrada, em paralelo (um processo por arquivo).
+    Arquivos .txt só entram se o bloco de leitura do fluxo estiver no modo texto.
+    out_of_core processa as cadeias de convolução/mediana/pontual faixa a faixa entre arquivos mapeados em
+    memória, para imagens RAW maiores que a RAM."""
+    os.makedirs(output_dir, exist_ok=True)
+    extensions = input_extensions(reader_parameters(load_workflow(workflow_path)))
+    files = sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(extensions)
+    )
+    jobs = [(workflow_path, path, output_dir, raw_ext, out_of_core) for path in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_file, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa um fluxo do PSE-Image sobre uma pasta de imagens.")
+    parser.add_argument("workflow", help="arquivo de fluxo (.json) salvo pela interface")
+    parser.add_argument("input_dir", help="pasta com arquivos RAW/JPEG/PNG de entrada")
+    parser.add_argument("output_dir", help="pasta onde os arquivos RAW de saída serão gravados")
+    parser.add_argument("--workers", type=int, default=None, help="número de processos (padrão: núcleos da CPU)")
+    parser.add_argument("--plan", action="store_true", help="mostra o plano compilado do fluxo antes de executar")
+    parser.add_argument("--formato", choices=sorted(OUTPUT_FORMATS), default="raw",
+                        help="formato das saídas: raw puro, praw (com cabeçalho) ou craw (em blocos comprimidos)")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="processa convolução/mediana/pontual em faixas lidas do disco (imagens maiores que a RAM)")
+    args = parser.parse_args(argv)
+    if args.plan:
+        print(compile_workflow(load_workflow(args.workflow)).describe())
+    for summary in run_batch(args.workflow, args.input_dir, args.output_dir, args.workers,
+                             OUTPUT_FORMATS[args.formato], args.out_of_core):
+        print(json.dumps(summary, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
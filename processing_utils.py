@@ -1,77 +1,641 @@
 # processing_utils.py
+import os
+import contextvars
 import numpy as np
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
 
 def ensure_uint8(img):
     """Garante que o array seja np.uint8 e 2D (grayscale)."""
     if img is None:
         return None
-    a = np.array(img) # converte para array numpy
+    if isinstance(img, np.ndarray) and img.dtype == np.uint8 and img.ndim == 2:
+        return img # caso comum entre blocos: já está no formato, nenhuma cópia
+    a = np.asarray(img) # converte para array numpy (sem copiar se já for array)
     if a.ndim == 3 and a.shape[2] in (3,4): # RGB ou RGBA
         # converte para grayscale simples pela média
         a = np.mean(a[..., :3], axis=2) # ignora alpha se presente
-    a = np.clip(a, 0, 255) # limita valores
-    return a.astype(np.uint8)
+    if a.dtype == np.uint8:
+        return a.copy() # uint8 já está na faixa 0-255
+    a = np.clip(a, 0, 255) # limita valores (cria um array novo, o original não é alterado)
+    return a.astype(np.uint8, copy=False)
 
-def adjust_brightness(img, delta):
-    """Adiciona delta (pode ser negativo)."""
+# Pixels por faixa em operações que criam índices temporários (LUT, histograma)
+LUT_BAND_PIXELS = 1 << 16
+
+def _row_bands(shape, max_pixels):
+    """Divide as linhas em faixas (r0, r1) de no máximo max_pixels pixels."""
+    h, w = shape
+    rows = max(1, max_pixels // max(1, w))
+    return [(r0, min(r0 + rows, h)) for r0 in range(0, h, rows)]
+
+# --- Operações pontuais via tabela de consulta (LUT de 256 entradas) ---
+LEVELS = np.arange(256, dtype=np.int16) # todos os níveis de cinza possíveis em uint8
+
+def identity_lut():
+    """LUT que não altera a imagem."""
+    return LEVELS.astype(np.uint8)
+
+def brightness_lut(delta):
+    """LUT de brilho: soma delta e limita em 0-255."""
+    return np.clip(LEVELS + int(delta), 0, 255).astype(np.uint8)
+
+def threshold_lut(t, high_value=255, low_value=0):
+    """LUT de limiar binário: >= t -> high_value else low_value."""
+    return np.where(LEVELS >= t, high_value, low_value).astype(np.uint8)
+
+def negative_lut():
+    """LUT do negativo (255 - pixel)."""
+    return (255 - LEVELS).astype(np.uint8)
+
+def gamma_lut(gamma):
+    """LUT de correção gama: 255 * (pixel / 255) ** gamma."""
+    out = 255.0 * (LEVELS / 255.0) ** float(gamma)
+    return np.clip(np.round(out), 0, 255).astype(np.uint8)
+
+def contrast_stretch_lut(low, high):
+    """LUT de alargamento de contraste: mapeia [low, high] linearmente para [0, 255]."""
+    if high <= low:
+        return threshold_lut(low)
+    out = (LEVELS - float(low)) * (255.0 / (high - low))
+    return np.clip(np.round(out), 0, 255).astype(np.uint8)
+
+def compose_luts(*luts):
+    """Compõe LUTs na ordem de aplicação (a primeira é aplicada primeiro) em uma única LUT."""
+    out = identity_lut()
+    for lut in luts:
+        out = lut[out] # aplicar 'out' e depois 'lut' == indexar 'lut' por 'out'
+    return out
+
+def apply_lut(img, lut):
+    """Aplica uma LUT de 256 entradas com uma única leitura indexada."""
     img = ensure_uint8(img)
     if img is None: return None
-    out = img.astype(np.int16) + int(delta) #soma delta a cada pixel
-    out = np.clip(out, 0, 255).astype(np.uint8) #limita para 0-255
+    out = np.empty_like(img)
+    # np.take converte os índices para intp (8 bytes por pixel): em faixas, esse temporário fica pequeno
+    for r0, r1 in _row_bands(img.shape, LUT_BAND_PIXELS):
+        np.take(lut, img[r0:r1], out=out[r0:r1])
     return out
 
+def adjust_brightness(img, delta):
+    """Adiciona delta (pode ser negativo)."""
+    return apply_lut(img, brightness_lut(delta))
+
 def threshold(img, t, high_value=255, low_value=0):
     """Limiar binário: >= t -> high_value else low_value."""
+    return apply_lut(img, threshold_lut(t, high_value, low_value))
+
+def downsample_mean(img, factor):
+    """Reduz a imagem 'factor' vezes pela média de cada bloco factor x factor (arredondada).
+    Blocos incompletos na borda direita/inferior repetem o último pixel."""
     img = ensure_uint8(img)
-    if img is None: return None
-    out = np.where(img >= t, high_value, low_value).astype(np.uint8) # aplica limiar t
+    if img is None or factor <= 1: return img
+    h, w = img.shape
+    oh, ow = -(-h // factor), -(-w // factor)
+    area = factor * factor
+    out = np.empty((oh, ow), dtype=np.uint8)
+    rows = max(1, (LUT_BAND_PIXELS * 16) // max(1, w * factor)) # linhas de saída por faixa
+    for r0 in range(0, oh, rows):
+        check_cancelled()
+        r1 = min(r0 + rows, oh)
+        src = img[r0 * factor:r1 * factor]
+        pad_rows, pad_cols = (r1 - r0) * factor - src.shape[0], ow * factor - w
+        if pad_rows or pad_cols:
+            src = np.pad(src, ((0, pad_rows), (0, pad_cols)), mode='edge')
+        sums = src.reshape(r1 - r0, factor, ow, factor).sum(axis=(1, 3), dtype=np.uint32)
+        out[r0:r1] = (sums + area // 2) // area
     return out
 
-def pad_for_kernel(img, k_h, k_w, mode='edge'):
+def pad_for_kernel(img, k_h, k_w, mode='edge', dtype=None):
     # O Padding cria uma borda artificial para que o centro do kernel possa passar por todos os pixels originais
     # repete a borda (edge), constant (preto), criaria uma moldura escura artificial ao redor da imagem filtrad
     pad_h = k_h // 2 # metade da altura do kernel
     pad_w = k_w // 2 # metade da largura do kernel
-    return np.pad(img, ((pad_h, pad_h), (pad_w, pad_w)), mode=mode) # pad com borda repetida
+    if dtype is None or mode != 'edge':
+        padded = np.pad(img, ((pad_h, pad_h), (pad_w, pad_w)), mode=mode) # pad com borda repetida
+        return padded if dtype is None else padded.astype(dtype)
+    # Pad 'edge' direto no dtype final: uma única alocação em vez de pad + astype
+    h, w = img.shape
+    out = np.empty((h + 2 * pad_h, w + 2 * pad_w), dtype=dtype)
+    out[pad_h:pad_h + h, pad_w:pad_w + w] = img
+    out[:pad_h, pad_w:pad_w + w] = img[0] # repete a primeira linha
+    out[pad_h + h:, pad_w:pad_w + w] = img[-1] # repete a última linha
+    out[:, :pad_w] = out[:, pad_w:pad_w + 1] # repete a primeira coluna (inclui cantos)
+    out[:, pad_w + w:] = out[:, pad_w + w - 1:pad_w + w] # repete a última coluna
+    return out
+
+# --- Cancelamento cooperativo ---
+class Cancelled(Exception):
+    """Processamento interrompido a pedido do usuário."""
+
+# Evento de cancelamento da execução atual (por contexto, para cada execução ter o seu)
+_cancel_event = contextvars.ContextVar("cancel_event", default=None)
+
+def set_cancel_event(event):
+    """Associa um threading.Event ao contexto atual; quando ele for setado, os filtros param na próxima faixa."""
+    return _cancel_event.set(event)
+
+def check_cancelled():
+    """Lança Cancelled se a execução atual foi cancelada (chamado entre faixas/tiles)."""
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise Cancelled()
 
-def convolve2d(img, kernel):
-    """Convolução 2D simples"""
+# --- Execução em faixas (tiles) com várias threads ---
+# Número de threads dos filtros de vizinhança (None = os.cpu_count())
+NUM_WORKERS = None
+# Imagens com menos pixels que isso são processadas inteiras, sem dividir em faixas
+TILE_MIN_PIXELS = 256 * 256
+
+def run_tiled(func, img, halo, workers=None, band_rows=None):
+    """Aplica func (imagem uint8 -> imagem do mesmo tamanho) em faixas de linhas numa pool de threads.
+    Cada faixa leva 'halo' linhas vizinhas de cada lado, então o resultado é igual ao de func(img)
+    para filtros com alcance vertical <= halo (o NumPy libera o GIL nas operações pesadas)."""
+    ih, iw = img.shape
+    if workers is None:
+        workers = NUM_WORKERS or os.cpu_count() or 1
+    if band_rows is None:
+        if workers <= 1 or img.size < TILE_MIN_PIXELS:
+            return func(img)
+        # algumas faixas por thread para equilibrar a carga, mas largas o bastante frente ao halo
+        band_rows = max(-(-ih // (workers * 2)), 4 * halo, 16)
+    bands = [(r0, min(r0 + band_rows, ih)) for r0 in range(0, ih, band_rows)]
+    if len(bands) == 1:
+        return func(img)
+    out = np.empty((ih, iw), dtype=np.uint8) # saída única, cada faixa escreve na sua parte
+
+    def work(band):
+        check_cancelled()
+        r0, r1 = band
+        s0, s1 = max(0, r0 - halo), min(ih, r1 + halo) # faixa com halo, limitada às bordas da imagem
+        result = func(img[s0:s1])
+        out[r0:r1] = result[r0 - s0:r1 - s0]
+
+    if workers <= 1: # band_rows fixo com uma thread: faixas em sequência (limita a memória por faixa)
+        for band in bands:
+            work(band)
+        return out
+    with ThreadPoolExecutor(max_workers=min(workers, len(bands))) as pool:
+        # cada faixa roda numa cópia do contexto atual, para enxergar o mesmo evento de cancelamento
+        futures = [pool.submit(contextvars.copy_context().run, work, band) for band in bands]
+        for future in futures:
+            future.result() # propaga exceções das threads
+    return out
+
+# Limite (em bytes) do buffer temporário usado pela convolução vetorizada
+CONV_CHUNK_BYTES = 4 * 1024 * 1024
+# Peso relativo de cada termo N*log2(N) da FFT frente a uma multiplicação-acumulação direta
+FFT_COST_FACTOR = 0.1
+# Kernels menores que isso (em número de taps) sempre usam o caminho direto, que é exato
+FFT_MIN_KERNEL_AREA = 49
+
+def next_fast_len(n):
+    """Menor inteiro >= n cujos únicos fatores primos são 2, 3 e 5 (tamanhos rápidos para FFT)."""
+    best = 2 * n
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p235 = p35
+            while p235 < n: # completa com potências de 2
+                p235 *= 2
+            best = min(best, p235)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+def choose_conv_method(img_shape, kernel_shape):
+    """Modelo de custo simples: 'direct' ou 'fft' conforme tamanho da imagem e do kernel."""
+    ih, iw = img_shape
+    kh, kw = kernel_shape
+    if kh * kw < FFT_MIN_KERNEL_AREA:
+        return 'direct'
+    direct_cost = ih * iw * kh * kw # uma multiplicação-acumulação por tap por pixel
+    fh = next_fast_len(ih + 2 * (kh // 2))
+    fw = next_fast_len(iw + 2 * (kw // 2))
+    n = fh * fw
+    fft_cost = FFT_COST_FACTOR * 3 * n * np.log2(max(n, 2)) # FFT da imagem, do kernel e inversa
+    return 'fft' if fft_cost < direct_cost else 'direct'
+
+def _convolve_direct(img, kernel):
+    """Convolução direta vetorizada (janelas deslizantes processadas em faixas de linhas)."""
+    kh, kw = kernel.shape # dimensões do kernel
+    ih, iw = img.shape # dimensões da imagem
+    padded = pad_for_kernel(img, kh, kw, mode='edge', dtype=np.float64) # pad já em float64
+    windows = sliding_window_view(padded, (kh, kw))[:ih, :iw] # visão (ih, iw, kh, kw) sem cópia
+    out = np.empty((ih, iw), dtype=np.float64) # saída em float64
+    # Cada faixa multiplica as janelas pelo kernel num buffer contíguo e soma os dois últimos eixos,
+    # na mesma ordem de soma do np.sum(region * kernel) pixel a pixel (resultado idêntico bit a bit)
+    rows = max(1, min(ih, CONV_CHUNK_BYTES // max(1, iw * kh * kw * 8))) # linhas por faixa
+    buf = np.empty((rows, iw, kh, kw), dtype=np.float64) # buffer reaproveitado entre faixas
+    for r0 in range(0, ih, rows):
+        check_cancelled()
+        r1 = min(r0 + rows, ih)
+        prod = buf[:r1 - r0]
+        np.multiply(windows[r0:r1], kernel, out=prod) # produto elemento a elemento
+        prod.sum(axis=(2, 3), out=out[r0:r1]) # soma ponderada de cada janela
+    return out
+
+def _convolve_fft(img, kernel):
+    """Convolução via FFT com o mesmo padding de borda (edge) da versão direta."""
+    kh, kw = kernel.shape
+    ih, iw = img.shape
+    padded = pad_for_kernel(img, kh, kw, mode='edge') # mesma borda da convolução direta
+    ph, pw = padded.shape
+    fh, fw = next_fast_len(ph), next_fast_len(pw) # tamanhos rápidos para a FFT
+    # A convolução direta é uma correlação (kernel não espelhado): espelha para usar o produto espectral
+    spec = np.fft.rfft2(padded, s=(fh, fw)) * np.fft.rfft2(kernel[::-1, ::-1], s=(fh, fw))
+    full = np.fft.irfft2(spec, s=(fh, fw))
+    return full[kh - 1:kh - 1 + ih, kw - 1:kw - 1 + iw] # região válida = tamanho original
+
+def integral_image(a, dtype=np.int64):
+    """Tabela de somas acumuladas (summed-area table) com uma linha e uma coluna de zeros no início."""
+    h, w = a.shape
+    sat = np.zeros((h + 1, w + 1), dtype=dtype)
+    np.cumsum(a, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+def box_sum(img, kh, kw, dtype=np.int64):
+    """Soma de cada janela kh x kw (borda 'edge') em O(1) por pixel usando a tabela integral."""
+    padded = pad_for_kernel(img, kh, kw, mode='edge')
+    sat = integral_image(padded, dtype=dtype)
+    # soma da janela = D - B - C + A nos cantos do retângulo
+    sums = sat[kh:, kw:] - sat[:-kh, kw:] - sat[kh:, :-kw] + sat[:-kh, :-kw]
+    return sums[:img.shape[0], :img.shape[1]] # kernels de tamanho par geram uma linha/coluna a mais
+
+def is_identity_kernel(kernel):
+    """True se o kernel só copia o pixel central (a convolução devolve a própria imagem)."""
+    kernel = np.asarray(kernel, dtype=np.float64)
+    kh, kw = kernel.shape
+    return kernel[kh // 2, kw // 2] == 1 and np.count_nonzero(kernel) == 1
+
+def is_uniform_kernel(kernel):
+    """True se todos os coeficientes do kernel forem iguais (filtro de caixa)."""
+    return kernel.size > 0 and bool(np.all(kernel == kernel.flat[0]))
+
+def _match_direct_rounding(out, img, kernel):
+    """Recalcula pela soma direta os pixels cujo valor fica (quase) inteiro.
+    Nesses pixels o truncamento para uint8 depende do erro de arredondamento da soma em ponto
+    flutuante, então usar a mesma soma da versão direta mantém o resultado idêntico bit a bit."""
+    kh, kw = kernel.shape
+    frac = np.round(out)
+    np.subtract(out, frac, out=frac)
+    np.abs(frac, out=frac) # distância até o inteiro mais próximo
+    tol = np.abs(out)
+    np.maximum(tol, 1.0, out=tol)
+    tol *= 1e-6
+    near = frac <= tol
+    del frac, tol
+    near &= out > -1
+    near &= out < 256 # fora da faixa o clip decide sozinho
+    rr, cc = np.nonzero(near)
+    if rr.size:
+        padded = pad_for_kernel(img, kh, kw, mode='edge', dtype=np.float64)
+        windows = sliding_window_view(padded, (kh, kw))
+        for i in range(0, rr.size, 4096): # em lotes, para limitar a memória temporária
+            r, c = rr[i:i + 4096], cc[i:i + 4096]
+            out[r, c] = (windows[r, c] * kernel).sum(axis=(1, 2))
+    return out
+
+def _convolve_box(img, kernel):
+    """Filtro de caixa (kernel uniforme) pela tabela integral, com o mesmo resultado da versão direta."""
+    kh, kw = kernel.shape
+    out = box_sum(img, kh, kw) * kernel.flat[0] # soma exata (inteira) vezes o coeficiente
+    return _match_direct_rounding(out, img, kernel)
+
+# Tolerância relativa para aceitar um kernel como separável (posto 1)
+SEPARABLE_TOL = 1e-12
+
+def separable_factors(kernel, tol=SEPARABLE_TOL):
+    """Se o kernel tiver posto 1, retorna (coluna, linha) com outer(coluna, linha) == kernel; senão None.
+    Tenta primeiro fatores inteiros (ex.: Sobel, binomial), depois recorre à SVD."""
+    kernel = np.asarray(kernel, dtype=np.float64)
+    scale = np.abs(kernel).max() if kernel.size else 0.0
+    if scale == 0 or kernel.ndim != 2:
+        return None
+    # Pivô no menor coeficiente não nulo: kernel = outer(kernel[:, j], kernel[i, :] / kernel[i, j])
+    nz = np.abs(np.where(kernel != 0, kernel, np.inf))
+    i, j = np.unravel_index(np.argmin(nz), kernel.shape)
+    col = kernel[:, j].copy()
+    row = kernel[i, :] / kernel[i, j]
+    if np.array_equal(np.outer(col, row), kernel):
+        return col, row
+    u, sv, vt = np.linalg.svd(kernel)
+    if sv.size > 1 and sv[1] > tol * sv[0]:
+        return None
+    col = u[:, 0] * np.sqrt(sv[0])
+    row = vt[0] * np.sqrt(sv[0])
+    if np.abs(np.outer(col, row) - kernel).max() > tol * scale:
+        return None
+    return col, row
+
+def _convolve_separable(img, kernel, col, row):
+    """Convolução separável: uma passada 1D nas linhas e outra nas colunas (2k em vez de k² por pixel)."""
+    kh, kw = kernel.shape
+    ih, iw = img.shape
+    padded = pad_for_kernel(img, kh, kw, mode='edge', dtype=np.float64)
+    tmp = np.zeros((padded.shape[0], iw), dtype=np.float64)
+    scratch = np.empty_like(tmp) # buffer reaproveitado para o produto de cada tap
+    for j in range(kw): # passada horizontal (acumula colunas deslocadas)
+        np.multiply(padded[:, j:j + iw], row[j], out=scratch)
+        tmp += scratch
+    del padded # não é mais usado: libera antes de alocar a saída
+    out = np.zeros((ih, iw), dtype=np.float64)
+    for i in range(kh): # passada vertical (acumula linhas deslocadas)
+        np.multiply(tmp[i:i + ih, :], col[i], out=scratch[:ih])
+        out += scratch[:ih]
+    del tmp, scratch # idem, antes dos buffers do ajuste de arredondamento
+    exact = np.array_equal(col, np.round(col)) and np.array_equal(row, np.round(row))
+    if exact:
+        return out # fatores inteiros: as duas versões fazem aritmética inteira exata
+    return _match_direct_rounding(out, img, kernel)
+
+def convolve2d(img, kernel, method='auto', workers=None):
+    """Convolução 2D. method: 'auto' (escolhe pelo custo), 'direct', 'fft', 'box' (kernel uniforme)
+    ou 'separable' (kernel de posto 1). Imagens grandes são divididas em faixas entre 'workers' threads."""
     img = ensure_uint8(img)
     if img is None: return None
     kernel = np.array(kernel, dtype=np.float64)
-    kh, kw = kernel.shape # dimensões do kernel
-    ih, iw = img.shape # dimensões da imagem
-    padded = pad_for_kernel(img, kh, kw, mode='edge').astype(np.float64) # pad e converte para float64
-    out = np.zeros((ih, iw), dtype=np.float64) # saída em float64
-    # Convolução direta
-    for r in range(ih):
-        for c in range(iw):
-            region = padded[r:r+kh, c:c+kw] # região da imagem
-            out[r, c] = np.sum(region * kernel) # soma ponderada
+    if method == 'auto': # decide uma vez para a imagem inteira, todas as faixas usam o mesmo caminho
+        method = choose_kernel_method(img.shape, kernel)
+    factors = None
+    if method == 'separable':
+        if kernel.shape[0] > 1 and kernel.shape[1] > 1:
+            factors = separable_factors(kernel)
+        if factors is None:
+            method = 'direct' # kernel não separável: caminho geral
+    return run_tiled(lambda band: _convolve_band(band, kernel, method, factors),
+                     img, kernel.shape[0] // 2, workers)
+
+def choose_kernel_method(img_shape, kernel):
+    """Caminho de convolução para o modo 'auto': caixa, separável, direto ou FFT."""
+    if is_uniform_kernel(kernel):
+        return 'box'
+    if kernel.shape[0] > 1 and kernel.shape[1] > 1 and separable_factors(kernel) is not None:
+        return 'separable'
+    return choose_conv_method(img_shape, kernel.shape)
+
+def _convolve_band(img, kernel, method, factors=None):
+    """Convolução de uma imagem (ou faixa) uint8 pelo caminho escolhido."""
+    if method == 'box':
+        out = _convolve_box(img, kernel)
+    elif method == 'separable':
+        out = _convolve_separable(img, kernel, *factors)
+    elif method == 'fft':
+        # O ruído de arredondamento da FFT mudaria o truncamento dos pixels (quase) inteiros: esses
+        # são refeitos pela soma direta, como nos outros caminhos rápidos
+        out = _match_direct_rounding(_convolve_fft(img, kernel), img, kernel)
+    else:
+        out = _convolve_direct(img, kernel)
     # Normalização se necessário: se kernel soma 1, fica ok; caso contrário, normalizamos para faixa 0..255
     # Mas mantemos valores sem normalização por padrão; apenas clip e uint8
-    out = np.clip(out, 0, 255).astype(np.uint8) # limita para 0-255 e converte para uint8
+    np.clip(out, 0, 255, out=out) # limita para 0-255 (no próprio buffer)
+    out = out.astype(np.uint8) # converte para uint8
+    return out
+
+# A partir desse tamanho de janela a mediana por histograma deslizante supera a ordenação parcial
+MEDIAN_HIST_MIN_KSIZE = 9
+
+def _median_partition(padded, ksize, out):
+    """Mediana por ordenação parcial das janelas (rápida para janelas pequenas)."""
+    ih, iw = out.shape
+    mid = (ksize * ksize) // 2 # posição do elemento central (ksize ímpar)
+    windows = sliding_window_view(padded, (ksize, ksize))
+    rows = max(1, min(ih, CONV_CHUNK_BYTES // max(1, iw * ksize * ksize))) # linhas por faixa
+    for r0 in range(0, ih, rows):
+        check_cancelled()
+        r1 = min(r0 + rows, ih)
+        flat = windows[r0:r1].reshape(r1 - r0, iw, ksize * ksize) # copia a faixa para um bloco contíguo
+        out[r0:r1] = np.partition(flat, mid, axis=2)[..., mid]
     return out
 
-def median_filter(img, ksize):
+def _median_histogram(padded, ksize, out):
+    """Mediana por histogramas de coluna atualizados incrementalmente (Huang / Perreault-Hébert).
+    O custo por pixel depende só dos 256 níveis de cinza, não do tamanho da janela."""
+    ih, iw = out.shape
+    pw = padded.shape[1]
+    cols = np.arange(pw)
+    rank = (ksize * ksize) // 2 + 1 # a mediana é o rank-ésimo menor valor da janela
+    col_hist = np.zeros((pw, 256), dtype=np.uint16) # histograma de cada coluna (ksize linhas)
+    for r in range(ksize):
+        col_hist[cols, padded[r]] += 1 # (coluna, valor) são pares únicos por linha
+    prefix = np.zeros((pw + 1, 256), dtype=np.uint16) # soma acumulada dos histogramas de coluna
+    for r in range(ih):
+        if r % 64 == 0:
+            check_cancelled()
+        if r:
+            # desliza a janela uma linha para baixo: sai a linha de cima, entra a de baixo
+            col_hist[cols, padded[r - 1]] -= 1
+            col_hist[cols, padded[r + ksize - 1]] += 1
+        np.cumsum(col_hist, axis=0, out=prefix[1:])
+        win_hist = prefix[ksize:] - prefix[:-ksize] # histograma da janela de cada pixel da linha
+        np.cumsum(win_hist, axis=1, out=win_hist)
+        out[r] = (win_hist < rank).sum(axis=1) # primeiro nível com acumulado >= rank
+    return out
+
+def median_filter(img, ksize, workers=None):
     """Filtro de mediana com janela quadrada ksize (ímpar)."""
     img = ensure_uint8(img)
     if img is None: return None
     if ksize % 2 == 0: # garante que ksize é ímpar
         ksize += 1 # torna ímpar
+    return run_tiled(lambda band: _median_band(band, ksize), img, ksize // 2, workers)
+
+def _median_band(img, ksize):
+    """Mediana de uma imagem (ou faixa) uint8 com ksize ímpar."""
     kh = kw = ksize # kernel quadrado
-    ih, iw = img.shape # dimensões da imagem
     padded = pad_for_kernel(img, kh, kw, mode='edge') # pad com borda repetida
-    out = np.zeros_like(img)# saída
-    for r in range(ih):
-        for c in range(iw):
-            region = padded[r:r+kh, c:c+kw] # região da imagem
-            out[r, c] = np.median(region) # mediana da região
-    return out.astype(np.uint8)
+    out = np.empty_like(img) # saída
+    if ksize >= MEDIAN_HIST_MIN_KSIZE:
+        return _median_histogram(padded, ksize, out)
+    return _median_partition(padded, ksize, out)
+
+# --- Cadeias de operações fundidas ---
+# Pixels (aprox.) de cada faixa de uma cadeia: os resultados intermediários ficam desse tamanho
+CHAIN_BAND_PIXELS = 1 << 20
+
+def op_halo(op):
+    """Linhas vizinhas de que uma operação ('lut', lut), ('conv', kernel) ou ('median', ksize) precisa."""
+    kind, arg = op
+    if kind == 'conv':
+        return np.shape(arg)[0] // 2
+    if kind == 'median':
+        return (arg | 1) // 2 # ksize par vira ímpar
+    return 0
+
+def apply_chain(img, ops, workers=None, band_rows=None):
+    """Aplica uma sequência de operações ('lut', lut), ('conv', kernel) e ('median', ksize) faixa a faixa:
+    cada faixa (com halo igual à soma dos alcances) passa por todas as operações antes da próxima, então os
+    intermediários têm o tamanho da faixa e não da imagem. O resultado é idêntico ao das operações uma a uma."""
+    img = ensure_uint8(img)
+    if img is None: return None
+    steps = []
+    for kind, arg in ops:
+        if kind == 'conv':
+            kernel = np.array(arg, dtype=np.float64)
+            method = choose_kernel_method(img.shape, kernel) # mesma escolha do convolve2d na imagem inteira
+            factors = separable_factors(kernel) if method == 'separable' else None
+            steps.append(lambda band, k=kernel, m=method, f=factors: _convolve_band(band, k, m, f))
+        elif kind == 'median':
+            ksize = arg | 1
+            steps.append(lambda band, k=ksize: _median_band(band, k))
+        else:
+            steps.append(lambda band, lut=arg: apply_lut(band, lut))
+    halo = sum(op_halo(op) for op in ops)
+
+    def run_band(band):
+        for step in steps:
+            band = step(band)
+        return band
+
+    if len(steps) == 1: # operação isolada: mesma divisão em faixas do filtro correspondente
+        return run_tiled(run_band, img, halo, workers)
+    if band_rows is None:
+        band_rows = max(CHAIN_BAND_PIXELS // max(1, img.shape[1]), 4 * halo, 16)
+    return run_tiled(run_band, img, halo, workers, band_rows)
+
+# --- Processamento fora da memória (out-of-core) ---
+# Tamanho (em bytes de entrada) de cada faixa lida do disco; a memória de pico acompanha esse valor
+OOC_BAND_BYTES = 8 * 1024 * 1024
+
+def open_raw_memmap(path, shape, mode='r', dtype=np.uint8, offset=0):
+    """Abre um arquivo RAW como np.memmap 2D (as páginas só são lidas do disco quando usadas).
+    No modo 'r' o os.fstat do arquivo de fato mapeado fica em 'file_stat' (usado pela chave do cache:
+    se o caminho for substituído depois, o mapa antigo continua identificado pelo arquivo antigo)."""
+    if mode != 'r':
+        return np.memmap(path, dtype=dtype, mode=mode, shape=tuple(shape), offset=offset)
+    with open(path, 'rb') as f:
+        mapped = np.memmap(f, dtype=dtype, mode=mode, shape=tuple(shape), offset=offset)
+        mapped.file_stat = os.fstat(f.fileno())
+    return mapped
+
+def map_raw_file(path, dtype=np.uint8, offset=0):
+    """Abre o arquivo RAW inteiro como memmap 1D somente leitura: a abertura é imediata e as páginas
+    só são lidas do disco quando os pixels forem usados."""
+    count = (os.path.getsize(path) - offset) // np.dtype(dtype).itemsize
+    if count <= 0:
+        raise ValueError("Arquivo vazio.")
+    return open_raw_memmap(path, (count,), mode='r', dtype=dtype, offset=offset)
+
+def reshape_view(data, shape):
+    """Os mesmos pixels com outra forma, sem copiar (ValueError se o array não for contíguo)."""
+    if not data.flags.c_contiguous:
+        raise ValueError("Array não contíguo: mudar a forma exigiria uma cópia.")
+    return data.reshape(shape) # contíguo: reshape é sempre uma visão
+
+def run_out_of_core(func, src, halo, out_path, band_rows=None):
+    """Aplica func faixa a faixa sobre src (tipicamente um memmap) e grava em out_path (memmap uint8).
+    Só uma faixa com halo fica em memória por vez, então o pico não depende do tamanho da imagem."""
+    ih, iw = src.shape
+    if band_rows is None:
+        band_rows = max(1, OOC_BAND_BYTES // max(1, iw))
+    out = open_raw_memmap(out_path, (ih, iw), mode='w+')
+    for r0 in range(0, ih, band_rows):
+        check_cancelled()
+        r1 = min(r0 + band_rows, ih)
+        s0, s1 = max(0, r0 - halo), min(ih, r1 + halo) # faixa com halo, limitada às bordas da imagem
+        result = func(np.asarray(src[s0:s1]))
+        out[r0:r1] = result[r0 - s0:r1 - s0]
+    out.flush()
+    return out
+
+def convolve2d_out_of_core(src, kernel, out_path, method='auto', band_rows=None, workers=None):
+    """convolve2d sobre uma imagem em disco, gravando o resultado em out_path."""
+    kernel = np.array(kernel, dtype=np.float64)
+    if method == 'auto': # decide uma vez para a imagem inteira
+        method = choose_kernel_method(src.shape, kernel)
+    return run_out_of_core(lambda band: convolve2d(band, kernel, method, workers),
+                           src, kernel.shape[0] // 2, out_path, band_rows)
+
+def median_filter_out_of_core(src, ksize, out_path, band_rows=None, workers=None):
+    """median_filter sobre uma imagem em disco, gravando o resultado em out_path."""
+    if ksize % 2 == 0: # garante que ksize é ímpar
+        ksize += 1
+    return run_out_of_core(lambda band: median_filter(band, ksize, workers),
+                           src, ksize // 2, out_path, band_rows)
+
+def apply_chain_out_of_core(src, ops, out_path, band_rows=None, workers=None):
+    """apply_chain sobre uma imagem em disco, gravando o resultado em out_path. Uma convolução ou mediana
+    isolada usa a função out-of-core correspondente."""
+    if len(ops) == 1 and ops[0][0] == 'conv':
+        return convolve2d_out_of_core(src, ops[0][1], out_path, band_rows=band_rows, workers=workers)
+    if len(ops) == 1 and ops[0][0] == 'median':
+        return median_filter_out_of_core(src, ops[0][1], out_path, band_rows, workers)
+    return run_out_of_core(lambda band: apply_chain(band, ops, workers),
+                           src, sum(op_halo(op) for op in ops), out_path, band_rows)
+
+def _level_counts(img):
+    """Quantos pixels há em cada nível 0..255 (bincount em faixas, sem copiar a imagem inteira)."""
+    counts = np.zeros(256, dtype=np.int64)
+    for r0, r1 in _row_bands(img.shape, LUT_BAND_PIXELS): # bincount converte os índices para intp
+        counts += np.bincount(img[r0:r1].ravel(), minlength=256)
+    return counts
+
+# Janela (lado, em pixels) e constantes do SSIM (Wang et al., 2004) para imagens de 8 bits
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# Pixels por faixa no SSIM: as tabelas integrais (int64) e os mapas da faixa ficam em poucos MB
+SSIM_BAND_PIXELS = 1 << 18
+
+def ssim(a, b, win=SSIM_WINDOW, workers=None):
+    """SSIM médio entre duas imagens uint8 de mesmo tamanho, com estatísticas locais em janela de caixa.
+    Calculado em faixas de linhas (com halo de win//2), então a memória não cresce com a imagem.
+    As somas das janelas vêm da tabela integral (exatas em inteiros), com a mesma borda 'edge' dos filtros;
+    médias, variâncias e covariância entram já multiplicadas por n² (n = win*win), o que cancela nas
+    razões do SSIM e deixa só a divisão final em float32."""
+    a = ensure_uint8(a)
+    b = ensure_uint8(b)
+    h, w = a.shape
+    halo = win // 2
+    n = win * win
+    c1 = np.float32(SSIM_C1 * n * n)
+    c2 = np.float32(SSIM_C2 * n * n)
+    # Com janelas pequenas tudo cabe em int32 (o maior termo é 2 * (n * 255)²). As tabelas integrais
+    # podem estourar, mas a soma de cada janela (D - B - C + A) sai exata em aritmética módulo 2^32.
+    acc = np.int32 if 2 * (n * 255) ** 2 < 2 ** 31 else np.int64
+
+    def band_sum(band):
+        check_cancelled()
+        r0, r1 = band
+        s0, s1 = max(0, r0 - halo), min(h, r1 + halo) # faixa com halo, limitada às bordas da imagem
+        keep = slice(r0 - s0, r1 - s0)
+        ba, bb = a[s0:s1], b[s0:s1]
+        sa = box_sum(ba, win, win, acc)[keep] # n * média local
+        sb = box_sum(bb, win, win, acc)[keep]
+        a16 = ba.astype(np.uint16) # 255 * 255 ainda cabe em uint16
+        b16 = bb.astype(np.uint16)
+        saa = box_sum(a16 * a16, win, win, acc)[keep]
+        sbb = box_sum(b16 * b16, win, win, acc)[keep]
+        sab = box_sum(a16 * b16, win, win, acc)[keep]
+        del a16, b16
+        sasb = sa * sb
+        ssq = sa * sa + sb * sb
+        # (2 mu_a mu_b + C1)(2 cov + C2) / ((mu_a² + mu_b² + C1)(var_a + var_b + C2)), tudo vezes n²
+        num = (2 * sasb).astype(np.float32) + c1
+        num *= (2 * (n * sab - sasb)).astype(np.float32) + c2
+        den = ssq.astype(np.float32) + c1
+        den *= (n * (saa + sbb) - ssq).astype(np.float32) + c2
+        num /= den
+        return float(np.sum(num, dtype=np.float64))
+
+    bands = _row_bands((h, w), SSIM_BAND_PIXELS)
+    if workers is None:
+        workers = NUM_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(bands) == 1:
+        total = sum(band_sum(band) for band in bands)
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(bands))) as pool:
+            # cada faixa roda numa cópia do contexto atual, para enxergar o mesmo evento de cancelamento
+            futures = [pool.submit(contextvars.copy_context().run, band_sum, band) for band in bands]
+            total = sum(f.result() for f in futures)
+    return total / (h * w)
 
 def img_diff(a, b):
-    """Retorna imagem diferença (abs) e métricas (MSE, PSNR approximado)."""
+    """Retorna imagem diferença (abs) e métricas (MSE, PSNR, SNR e SSIM)."""
     if a is None or b is None:
         return None, {}
     a = ensure_uint8(a)
@@ -82,30 +646,38 @@ def img_diff(a, b):
         min_w = min(a.shape[1], b.shape[1])
         a = a[:min_h, :min_w]
         b = b[:min_h, :min_w]
-    diff = np.abs(a.astype(np.int16) - b.astype(np.int16)).astype(np.uint8) # diferença absoluta
-    mse = np.mean((a.astype(np.float64) - b.astype(np.float64))**2) # erro quadrático médio
-    psnr = None
-    if mse == 0:
+    diff = np.maximum(a, b) # diferença absoluta em uint8: max - min, sem temporários int16
+    diff -= np.minimum(a, b)
+    # Métricas a partir dos histogramas de |A - B| e de A: somas de quadrados exatas em inteiros,
+    # sem converter as imagens para float (o erro ao quadrado é calculado uma única vez)
+    n = diff.size
+    squares = np.arange(256, dtype=np.int64) ** 2
+    sse = int(_level_counts(diff) @ squares) # soma dos erros ao quadrado
+    mse = sse / n # erro quadrático médio
+    if sse == 0:
         psnr = float('inf') # imagens idênticas
     else:
         PIXEL_MAX = 255.0 # valor máximo do pixel
         psnr = 10 * np.log10((PIXEL_MAX**2) / mse) # PSNR - Peak Signal-to-Noise Ratio
-    # SNR simples
-    signal_power = np.mean(a.astype(np.float64)**2) # potência do sinal
-    noise_power = np.mean((a.astype(np.float64) - b.astype(np.float64))**2) # potência do ruído
-    snr = None
-    if noise_power == 0:
+    # SNR simples: potência do sinal (A) sobre a potência do ruído (o próprio MSE)
+    signal_power = int(_level_counts(a) @ squares) / n
+    if sse == 0:
         snr = float('inf') # sem ruído
     else:
-        snr = 10 * np.log10(signal_power / noise_power) # SNR - Signal-to-Noise Ratio
-    metrics = {"mse": float(mse), "psnr": float(psnr) if psnr is not None else None, "snr": float(snr) if snr is not None else None}
+        snr = 10 * np.log10(signal_power / mse) # SNR - Signal-to-Noise Ratio
+    metrics = {"mse": float(mse), "psnr": float(psnr), "snr": float(snr), "ssim": ssim(a, b)}
     return diff, metrics
 
 def compute_histogram(img, bins=256):
     """Retorna histograma (counts, bin_edges)."""
     img = ensure_uint8(img)
     if img is None: return None, None
-    hist, edges = np.histogram(img.flatten(), bins=bins, range=(0, 255)) # histograma e edges
+    if bins == 256:
+        # com 256 bins em [0, 255] cada nível cai no próprio bin: contagem direta, sem cópia da imagem
+        hist = _level_counts(img)
+        edges = np.linspace(0, 255, bins + 1)
+        return hist, edges
+    hist, edges = np.histogram(img.ravel(), bins=bins, range=(0, 255)) # histograma e edges
     return hist, edges
 
 def kernel_from_text(text):
@@ -0,0 +1,152 @@
+# profiling.py
+# Medidas de cada bloco numa execução do fluxo (tempo, CPU, memória de pico, saída) e exportação do
+# relatório em JSON, CSV ou no formato de trace do Chrome (abre em chrome://tracing ou no Perfetto).
+# Sem dependência do Qt.
+import os
+import csv
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Colunas do relatório (mesma ordem no CSV)
+REPORT_FIELDS = ["block", "block_id", "start_ms", "wall_ms", "cpu_ms", "peak_bytes",
+                 "shape", "dtype", "cached", "thread"]
+
+
+class BlockProfile:
+    """Medidas de um bloco numa execução. start_ms é relativo ao início da execução."""
+    def __init__(self, block, block_id=None):
+        self.block = block
+        self.block_id = block_id
+        self.start_ms = 0.0
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.peak_bytes = None # None quando a memória não está sendo rastreada
+        self.shape = None
+        self.dtype = None
+        self.cached = False # resultado veio do cache (process não rodou)
+        self.thread = threading.get_ident()
+
+    def set_output(self, data):
+        """Guarda forma e tipo da saída do bloco (se for um array)."""
+        self.shape = tuple(data.shape) if hasattr(data, "shape") else None
+        self.dtype = str(data.dtype) if hasattr(data, "dtype") else None
+
+    def badge(self):
+        """Texto curto para desenhar no bloco."""
+        if self.cached:
+            return "cache"
+        if self.wall_ms < 1000:
+            return f"{self.wall_ms:.1f} ms"
+        return f"{self.wall_ms / 1000:.2f} s"
+
+    def to_dict(self):
+        d = {field: getattr(self, field) for field in REPORT_FIELDS}
+        d["shape"] = list(self.shape) if self.shape is not None else None
+        return d
+
+
+class RunProfiler:
+    """Coleta as medidas dos blocos de uma execução (seguro entre threads).
+    O tempo de CPU é o do processo durante o bloco: inclui as threads das faixas do próprio filtro, mas
+    também as de outros blocos que estejam rodando em paralelo. A memória de pico vem do tracemalloc
+    (o NumPy registra nele os buffers dos arrays); com blocos em paralelo o pico de um inclui os demais."""
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory
+        self.records = []
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._active = 0 # blocos sendo medidos agora
+        self._owns_tracing = False
+
+    def start(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+
+    def stop(self):
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    @contextmanager
+    def measure(self, block, block_id=None):
+        """Mede o trecho do 'with'; o BlockProfile retornado pode receber a saída (set_output)."""
+        record = BlockProfile(block, block_id)
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        with self._lock:
+            if tracing and self._active == 0:
+                tracemalloc.reset_peak() # só zera se ninguém mais está medindo o próprio pico
+            self._active += 1
+        base = tracemalloc.get_traced_memory()[0] if tracing else 0
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_ms = (time.perf_counter() - wall0) * 1000
+            record.cpu_ms = (time.process_time() - cpu0) * 1000
+            record.start_ms = (wall0 - self._t0) * 1000
+            if tracing and tracemalloc.is_tracing():
+                record.peak_bytes = max(0, tracemalloc.get_traced_memory()[1] - base)
+            with self._lock:
+                self._active -= 1
+                self.records.append(record)
+
+    def total_ms(self):
+        return max((r.start_ms + r.wall_ms for r in self.records), default=0.0)
+
+    def summary(self, top=None):
+        """Linhas de texto com os blocos do mais lento para o mais rápido."""
+        lines = []
+        for r in sorted(self.records, key=lambda r: r.wall_ms, reverse=True)[:top]:
+            peak = f"{r.peak_bytes / 2**20:.1f} MB" if r.peak_bytes is not None else "-"
+            shape = "x".join(str(n) for n in r.shape) if r.shape else "-"
+            lines.append(f"{r.block}: {r.badge()} (CPU {r.cpu_ms:.1f} ms, pico {peak}, saída {shape} {r.dtype or ''})")
+        return lines
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "total_ms": self.total_ms(),
+            "blocks": [r.to_dict() for r in self.records],
+        }
+
+    def to_chrome_trace(self):
+        """Eventos completos ('X') do Trace Event Format, um por bloco, em microssegundos."""
+        pid = os.getpid()
+        events = []
+        for r in self.records:
+            events.append({
+                "name": r.block,
+                "cat": "cache" if r.cached else "block",
+                "ph": "X",
+                "ts": r.start_ms * 1000,
+                "dur": r.wall_ms * 1000,
+                "pid": pid,
+                "tid": r.thread,
+                "args": {k: v for k, v in r.to_dict().items() if k not in ("block", "start_ms", "wall_ms", "thread")},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def save_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            for r in self.records:
+                row = r.to_dict()
+                row["shape"] = "x".join(str(n) for n in r.shape) if r.shape else ""
+                writer.writerow(row)
+
+    def save_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
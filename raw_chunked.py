@@ -0,0 +1,239 @@
+# raw_chunked.py
+# RAW em blocos (.craw): a imagem é dividida em tiles comprimidos um a um (zlib ou lzma, da biblioteca
+# padrão), com um índice de onde cada tile está no arquivo. Um tile pode ser lido e descomprimido
+# sozinho (processamento por tiles, prévias) e a compressão dos tiles roda num pool de threads
+# (zlib e lzma liberam o GIL enquanto comprimem).
+#
+# Layout:
+#   [cabeçalho fixo (HEADER_STRUCT)] [procedência JSON UTF-8] [tiles comprimidos...] [índice]
+# O índice (deslocamento e tamanho de cada tile, em ordem de linhas da grade) fica no fim porque os
+# tamanhos só são conhecidos depois de comprimir; o cabeçalho é regravado no fim com a posição dele.
+import os
+import json
+import lzma
+import zlib
+import stat
+import struct
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CHUNKED_EXTENSION = ".craw"
+MAGIC = b"\x89PSETIL\n"
+VERSION = 1
+CODECS = ("none", "zlib", "lzma")
+DEFAULT_CODEC = "zlib"
+DEFAULT_LEVEL = {"none": 0, "zlib": 6, "lzma": 3}
+TILE_SHAPE = (256, 256)
+
+# assinatura, versão, codec, nível, dtype (np.dtype.str), altura, largura, altura e largura do tile,
+# deslocamento do índice, bytes da procedência
+HEADER_STRUCT = struct.Struct("<8sHBB16sQQIIQI")
+INDEX_ENTRY = np.dtype([("offset", "<u8"), ("nbytes", "<u8")])
+
+
+def is_chunked_path(path):
+    """O arquivo deve ser gravado em blocos? (decidido pela extensão escolhida)"""
+    return str(path).lower().endswith(CHUNKED_EXTENSION)
+
+
+def is_chunked(path):
+    """O arquivo existente começa com a assinatura do formato em blocos?"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+@contextmanager
+def atomic_output(path):
+    """Arquivo aberto para gravação que só substitui 'path' no fim, com os.replace(). Os bytes vão para um
+    temporário na mesma pasta, então 'path' pode ser a própria imagem de origem mapeada em memória: o
+    memmap continua vendo o arquivo antigo em vez de ser truncado no meio da leitura (no Windows, onde um
+    arquivo mapeado não pode ser substituído, a gravação falha com PermissionError e uma mensagem clara).
+    Se a gravação falhar, o temporário é apagado e 'path' fica como estava."""
+    path = os.fspath(path)
+    tmp = os.path.join(os.path.dirname(os.path.abspath(path)),
+                       f".{os.path.basename(path)}.{os.urandom(6).hex()}.tmp")
+    # Mesmas permissões que open(path, 'wb') daria: as do arquivo existente, ou as padrão (com umask)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if os.path.exists(path):
+                os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+            yield f
+        try:
+            os.replace(tmp, path)
+        except PermissionError as e:
+            # No Windows um arquivo mapeado em memória (ex.: a imagem de um bloco de Leitura) não pode ser
+            # substituído enquanto o mapa existir
+            raise PermissionError(f"Não foi possível substituir '{path}': o arquivo está em uso (por exemplo, "
+                                  "é a imagem aberta num bloco de Leitura). Salve com outro nome ou carregue "
+                                  "outra imagem nesse bloco antes de gravar por cima.") from e
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _compress(raw, codec, level):
+    if codec == "zlib":
+        return zlib.compress(raw, level)
+    if codec == "lzma":
+        return lzma.compress(raw, preset=level)
+    return raw
+
+
+def _decompress(raw, codec):
+    if codec == "zlib":
+        return zlib.decompress(raw)
+    if codec == "lzma":
+        return lzma.decompress(raw)
+    return raw
+
+
+def _tile_bounds(shape, tile_shape):
+    """(r0, r1, c0, c1) de cada tile, em ordem de linhas da grade."""
+    h, w = shape
+    th, tw = tile_shape
+    return [(r0, min(r0 + th, h), c0, min(c0 + tw, w))
+            for r0 in range(0, h, th) for c0 in range(0, w, tw)]
+
+
+def write_chunked(path, data, tile_shape=TILE_SHAPE, codec=DEFAULT_CODEC, level=None,
+                  provenance=None, workers=None):
+    """Grava a imagem 2D 'data' em tiles comprimidos independentemente. Os tiles são comprimidos em
+    paralelo (no máximo alguns por thread em andamento, então a memória extra é só de poucos tiles) e
+    gravados em ordem."""
+    data = np.asarray(data)
+    if data.ndim != 2:
+        raise ValueError(f"Esperada imagem 2D, recebida forma {data.shape}.")
+    if codec not in CODECS:
+        raise ValueError(f"Compressão desconhecida: {codec} (use {', '.join(CODECS)}).")
+    level = DEFAULT_LEVEL[codec] if level is None else int(level)
+    if not 0 <= level <= 9:
+        raise ValueError(f"Nível de compressão deve estar entre 0 e 9 (recebido {level}).")
+    tile_shape = tuple(int(n) for n in tile_shape)
+    meta = json.dumps(provenance, ensure_ascii=False, default=str).encode('utf-8') if provenance else b""
+    bounds = _tile_bounds(data.shape, tile_shape)
+    index = np.zeros(len(bounds), dtype=INDEX_ENTRY)
+
+    def header(index_offset):
+        return HEADER_STRUCT.pack(MAGIC, VERSION, CODECS.index(codec), level, data.dtype.str.encode('ascii'),
+                                  data.shape[0], data.shape[1], tile_shape[0], tile_shape[1],
+                                  index_offset, len(meta))
+
+    def compress_tile(b):
+        r0, r1, c0, c1 = b
+        return _compress(np.ascontiguousarray(data[r0:r1, c0:c1]).tobytes(), codec, level)
+
+    workers = workers or min(32, (os.cpu_count() or 1) + 4) # o mesmo padrão do ThreadPoolExecutor
+    with atomic_output(path) as f, ThreadPoolExecutor(max_workers=workers) as pool:
+        f.write(header(0)) # provisório: a posição do índice só é conhecida no fim
+        f.write(meta)
+        for start in range(0, len(bounds), 4 * workers):
+            batch = range(start, min(start + 4 * workers, len(bounds)))
+            futures = [pool.submit(compress_tile, bounds[k]) for k in batch]
+            for k, future in zip(batch, futures): # grava na ordem dos tiles
+                raw = future.result()
+                index[k] = (f.tell(), len(raw))
+                f.write(raw)
+        index_offset = f.tell()
+        f.write(index.tobytes())
+        f.seek(0)
+        f.write(header(index_offset))
+
+
+class ChunkedRaw:
+    """Leitura de um arquivo .craw: cada tile é lido do disco e descomprimido só quando pedido.
+    Pode ser usado por várias threads ao mesmo tempo (as leituras do arquivo são serializadas)."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+        try:
+            raw = self._file.read(HEADER_STRUCT.size)
+            if len(raw) < HEADER_STRUCT.size or not raw.startswith(MAGIC):
+                raise ValueError("Arquivo não está no formato RAW em blocos.")
+            (_, version, codec, self.level, dtype_str, h, w, th, tw,
+             index_offset, meta_bytes) = HEADER_STRUCT.unpack(raw)
+            if version > VERSION:
+                raise ValueError(f"Versão {version} do formato não suportada (máximo {VERSION}).")
+            if codec >= len(CODECS) or th == 0 or tw == 0:
+                raise ValueError("Cabeçalho corrompido.")
+            self.codec = CODECS[codec]
+            self.dtype = np.dtype(dtype_str.rstrip(b"\0").decode('ascii'))
+            self.shape = (h, w)
+            self.tile_shape = (th, tw)
+            self.grid = (-(-h // th), -(-w // tw)) # tiles por coluna e por linha
+            meta = self._file.read(meta_bytes)
+            self.provenance = json.loads(meta.decode('utf-8')) if meta else None
+            n_tiles = self.grid[0] * self.grid[1]
+            self._file.seek(index_offset)
+            index_raw = self._file.read(n_tiles * INDEX_ENTRY.itemsize)
+            if index_offset == 0 or len(index_raw) < n_tiles * INDEX_ENTRY.itemsize:
+                raise ValueError("Arquivo truncado: índice dos tiles incompleto.")
+            self.index = np.frombuffer(index_raw, dtype=INDEX_ENTRY)
+        except Exception:
+            self._file.close()
+            raise
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def tile_bounds(self, ty, tx):
+        """(r0, r1, c0, c1) do tile na linha ty e coluna tx da grade."""
+        th, tw = self.tile_shape
+        r0, c0 = ty * th, tx * tw
+        return r0, min(r0 + th, self.shape[0]), c0, min(c0 + tw, self.shape[1])
+
+    def read_tile(self, ty, tx):
+        """Pixels de um único tile (só esse trecho do arquivo é lido e descomprimido)."""
+        if not (0 <= ty < self.grid[0] and 0 <= tx < self.grid[1]):
+            raise IndexError(f"Tile ({ty}, {tx}) fora da grade {self.grid}.")
+        offset, nbytes = self.index[ty * self.grid[1] + tx]
+        with self._lock:
+            self._file.seek(int(offset))
+            raw = self._file.read(int(nbytes))
+        r0, r1, c0, c1 = self.tile_bounds(ty, tx)
+        return np.frombuffer(_decompress(raw, self.codec), dtype=self.dtype).reshape(r1 - r0, c1 - c0)
+
+    def read_region(self, r0, r1, c0, c1, workers=None):
+        """Pixels [r0:r1, c0:c1], descomprimindo só os tiles que cruzam a região (em paralelo)."""
+        h, w = self.shape
+        r0, r1, c0, c1 = max(0, r0), min(h, r1), max(0, c0), min(w, c1)
+        out = np.empty((max(0, r1 - r0), max(0, c1 - c0)), dtype=self.dtype)
+        if out.size == 0:
+            return out
+        th, tw = self.tile_shape
+        tiles = [(ty, tx) for ty in range(r0 // th, (r1 - 1) // th + 1)
+                 for tx in range(c0 // tw, (c1 - 1) // tw + 1)]
+
+        def place(t):
+            tile = self.read_tile(*t)
+            tr0, tr1, tc0, tc1 = self.tile_bounds(*t)
+            a0, a1, b0, b1 = max(r0, tr0), min(r1, tr1), max(c0, tc0), min(c1, tc1)
+            out[a0 - r0:a1 - r0, b0 - c0:b1 - c0] = tile[a0 - tr0:a1 - tr0, b0 - tc0:b1 - tc0]
+
+        if len(tiles) == 1:
+            place(tiles[0])
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(place, tiles))
+        return out
+
+    def read(self, workers=None):
+        """A imagem inteira."""
+        return self.read_region(0, self.shape[0], 0, self.shape[1], workers)
+
+
+def read_chunked(path, workers=None):
+    """A imagem inteira de um arquivo .craw."""
+    with ChunkedRaw(path) as f:
+        return f.read(workers)
+
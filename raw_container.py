@@ -0,0 +1,158 @@
+# raw_container.py
+# Formato RAW com cabeçalho (.praw): guarda forma, tipo, strides e, opcionalmente, a procedência do
+# arquivo (JSON), para que a imagem abra sem adivinhar a resolução.
+#
+# Layout:
+#   [cabeçalho fixo (HEADER_STRUCT)] [procedência JSON UTF-8] [zeros até PAYLOAD_ALIGN] [pixels]
+# Os pixels ficam num deslocamento alinhado, então o np.memmap abre o arquivo direto, sem cópia.
+# Um .raw puro (só os pixels) continua sendo lido e gravado como antes; o formato é reconhecido
+# pela assinatura no início do arquivo, não pela extensão. O formato em blocos comprimidos (.craw)
+# fica em raw_chunked.py.
+import json
+import struct
+from datetime import datetime
+
+import numpy as np
+
+import raw_chunked
+import processing_utils as pu
+
+CONTAINER_EXTENSION = ".praw"
+MAGIC = b"\x89PSERAW\n" # primeiro byte fora do ASCII, como no PNG: não confunde com texto
+VERSION = 1
+MAX_DIMS = 4
+PAYLOAD_ALIGN = 4096 # tamanho de página: o início dos pixels cai numa página própria
+
+# assinatura, versão, ndim, dtype (np.dtype.str), deslocamento dos pixels, bytes dos pixels,
+# bytes da procedência, forma e strides (MAX_DIMS cada, zeros nas dimensões não usadas)
+HEADER_STRUCT = struct.Struct(f"<8sHH16sQQI{MAX_DIMS}Q{MAX_DIMS}q")
+
+
+def is_container_path(path):
+    """O arquivo deve ser gravado com cabeçalho? (decidido pela extensão escolhida)"""
+    return str(path).lower().endswith(CONTAINER_EXTENSION)
+
+
+def is_container(path):
+    """O arquivo existente começa com a assinatura do formato?"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _c_strides(shape, itemsize):
+    strides = []
+    step = itemsize
+    for n in reversed(shape):
+        strides.append(step)
+        step *= n
+    return tuple(reversed(strides))
+
+
+def _payload_offset(provenance_bytes):
+    end = HEADER_STRUCT.size + provenance_bytes
+    return -(-end // PAYLOAD_ALIGN) * PAYLOAD_ALIGN
+
+
+def make_provenance(**fields):
+    """Procedência padrão (programa e data de criação) mais os campos dados."""
+    return {"software": "PSE-Image", "created": datetime.now().isoformat(timespec='seconds'), **fields}
+
+
+def _encode_provenance(provenance):
+    if not provenance:
+        return b""
+    return json.dumps(provenance, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def write_header(f, shape, dtype, strides=None, provenance=None):
+    """Grava cabeçalho, procedência e o preenchimento na posição atual de 'f' (o início do arquivo) e
+    retorna o deslocamento dos pixels. Como o tamanho só depende da procedência, pode ser regravado
+    depois com a forma final (útil quando os pixels são gravados em pedaços)."""
+    dtype = np.dtype(dtype)
+    shape = tuple(int(n) for n in shape)
+    if not 1 <= len(shape) <= MAX_DIMS:
+        raise ValueError(f"O formato aceita de 1 a {MAX_DIMS} dimensões (recebido {len(shape)}).")
+    strides = _c_strides(shape, dtype.itemsize) if strides is None else tuple(int(s) for s in strides)
+    meta = _encode_provenance(provenance)
+    offset = _payload_offset(len(meta))
+    payload_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    pad = MAX_DIMS - len(shape)
+    f.write(HEADER_STRUCT.pack(MAGIC, VERSION, len(shape), dtype.str.encode('ascii'),
+                               offset, payload_bytes, len(meta),
+                               *shape, *([0] * pad), *strides, *([0] * pad)))
+    f.write(meta)
+    f.write(b"\0" * (offset - HEADER_STRUCT.size - len(meta)))
+    return offset
+
+
+def write_container(path, data, provenance=None):
+    """Grava 'data' com cabeçalho. Arrays em ordem C ou Fortran são gravados como estão (os strides
+    do cabeçalho dizem a ordem); outros layouts são copiados para ordem C antes."""
+    data = np.asarray(data)
+    if data.flags.c_contiguous:
+        payload, strides = data, None
+    elif data.flags.f_contiguous:
+        payload, strides = data.T, data.strides # data.T é contíguo em C: mesmos bytes do disco
+    else:
+        payload, strides = np.ascontiguousarray(data), None
+    with raw_chunked.atomic_output(path) as f:
+        write_header(f, data.shape, data.dtype, strides, provenance)
+        payload.tofile(f)
+
+
+def read_header(path):
+    """Dicionário com shape, dtype, strides, offset, payload_bytes e provenance.
+    Lança ValueError se o arquivo não estiver no formato ou estiver truncado."""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_STRUCT.size)
+        if len(raw) < HEADER_STRUCT.size or not raw.startswith(MAGIC):
+            raise ValueError("Arquivo não está no formato RAW com cabeçalho.")
+        fields = HEADER_STRUCT.unpack(raw)
+        _, version, ndim, dtype_str, offset, payload_bytes, meta_bytes = fields[:7]
+        if version > VERSION:
+            raise ValueError(f"Versão {version} do formato não suportada (máximo {VERSION}).")
+        if not 1 <= ndim <= MAX_DIMS:
+            raise ValueError("Cabeçalho corrompido (número de dimensões).")
+        shape = tuple(fields[7:7 + ndim])
+        strides = tuple(fields[7 + MAX_DIMS:7 + MAX_DIMS + ndim])
+        meta = f.read(meta_bytes)
+        f.seek(0, 2)
+        size = f.tell()
+    if size < offset + payload_bytes:
+        raise ValueError("Arquivo truncado: faltam pixels.")
+    return {
+        "shape": shape,
+        "dtype": np.dtype(dtype_str.rstrip(b"\0").decode('ascii')),
+        "strides": strides,
+        "offset": offset,
+        "payload_bytes": payload_bytes,
+        "provenance": json.loads(meta.decode('utf-8')) if meta else None,
+    }
+
+
+def open_container(path, mode='r'):
+    """Array com forma, tipo e strides do cabeçalho, mapeado em memória (np.memmap, sem ler os pixels)."""
+    header = read_header(path)
+    shape, dtype, strides = header["shape"], header["dtype"], header["strides"]
+    if strides == _c_strides(shape, dtype.itemsize):
+        return pu.open_raw_memmap(path, shape, mode, dtype, header["offset"])
+    # Outro layout: confere que todos os elementos caem dentro dos pixels e monta a visão com os strides
+    extent = sum((n - 1) * s for n, s in zip(shape, strides)) + dtype.itemsize
+    if any(s < 0 for s in strides) or extent > header["payload_bytes"]:
+        raise ValueError("Cabeçalho corrompido (strides fora dos pixels).")
+    buffer = pu.open_raw_memmap(path, (header["payload_bytes"],), mode, np.uint8, header["offset"])
+    return np.ndarray(shape, dtype=dtype, buffer=buffer, strides=strides)
+
+
+def save_raw(path, data, provenance=None, codec=raw_chunked.DEFAULT_CODEC):
+    """Grava pixels uint8 no formato indicado pela extensão: .praw com cabeçalho, .craw em blocos
+    comprimidos com 'codec', qualquer outra como RAW puro. O arquivo só é substituído quando a gravação
+    termina (raw_chunked.atomic_output), então 'data' pode estar mapeada do próprio 'path'."""
+    data = np.asarray(data, dtype=np.uint8)
+    if raw_chunked.is_chunked_path(path):
+        raw_chunked.write_chunked(path, data, codec=codec, provenance=provenance)
+    elif is_container_path(path):
+        write_container(path, data, provenance)
+    else:
+        with raw_chunked.atomic_output(path) as f:
+            data.tofile(f)
@@ -0,0 +1,118 @@
+# raw_text.py
+# Leitura de imagens gravadas como texto (números separados por espaços/linhas) para pixels uint8.
+# O arquivo é lido em pedaços e cada pedaço é convertido de uma vez com NumPy, sem laço por número.
+# Usado pela interface (modo "Texto/ASCII") e pelo converter_binario_raw.py.
+import numpy as np
+
+# Bytes lidos por pedaço: a memória temporária fica proporcional a isso, não ao tamanho do arquivo
+TEXT_CHUNK_BYTES = 1 << 20
+
+_SEPARATORS = b" \t\n\r\x0b\x0c"
+_UTF8_BOM = b"\xef\xbb\xbf"
+
+_IS_SPACE = np.zeros(256, dtype=bool)
+_IS_SPACE[list(_SEPARATORS)] = True
+_IS_DIGIT = np.zeros(256, dtype=bool)
+_IS_DIGIT[ord('0'):ord('9') + 1] = True
+_POW10 = np.array([1, 10, 100, 1000], dtype=np.int64)
+
+
+def _count_in_tokens(mask, starts, ends):
+    """Quantos elementos de 'mask' caem em cada token [start, end)."""
+    cum = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    return cum[ends] - cum[starts]
+
+
+def parse_bytes(buf, signed=True):
+    """Pixels dos números de 'buf' (bytes terminados num separador ou no fim do arquivo).
+    Aceita o mesmo que o leitor antigo da interface: sinal '-' opcional no início, dígitos e no máximo um
+    ponto (a parte decimal é descartada, como int(float(x))). Outros tokens são ignorados.
+    Com signed=False, tokens com '-' também são ignorados, como fazia o filtro isdigit() do
+    converter_binario_raw.py antigo (um '-5' perdido no arquivo não interrompe a conversão).
+    Lança ValueError se algum número aceito estiver fora de 0..255."""
+    b = np.frombuffer(buf, dtype=np.uint8)
+    space = _IS_SPACE[b]
+    digit = _IS_DIGIT[b]
+    if not digit.any():
+        return np.empty(0, dtype=np.uint8)
+    if (space | digit).all():
+        # Caso comum (só inteiros sem sinal): o parser de texto em C do NumPy lê tudo de uma vez
+        return _check_range(np.fromstring(buf, dtype=np.int64, sep=' '))
+
+    edges = np.diff(np.concatenate(([1], space.view(np.int8), [1])))
+    starts = np.flatnonzero(edges == -1) # separador -> caractere
+    ends = np.flatnonzero(edges == 1) # caractere -> separador (exclusivo)
+    if starts.size == 0:
+        return np.empty(0, dtype=np.uint8)
+
+    dot = b == ord('.')
+    minus = b == ord('-') if signed else np.zeros(b.size, dtype=bool) # sem sinal: '-' invalida o token
+    other = ~(space | digit | dot | minus)
+    n_minus = _count_in_tokens(minus, starts, ends)
+    has_minus = b[starts] == ord('-')
+    valid = ((_count_in_tokens(other, starts, ends) == 0)
+             & (_count_in_tokens(dot, starts, ends) <= 1)
+             & (n_minus == has_minus)
+             & (_count_in_tokens(digit, starts, ends) >= 1))
+
+    # Parte inteira de cada token: do primeiro dígito (depois do '-') até o ponto ou o fim
+    int_end = ends.copy()
+    dot_pos = np.flatnonzero(dot)
+    dot_token = np.searchsorted(starts, dot_pos, side='right') - 1
+    int_end[dot_token] = dot_pos # tokens com mais de um ponto já são inválidos
+    int_start = starts + has_minus
+
+    marker = np.zeros(b.size, dtype=np.int8)
+    marker[starts] = 1
+    token_of = np.maximum(np.cumsum(marker, dtype=np.int64) - 1, 0) # token de cada caractere
+    pos = np.arange(b.size)
+    in_int = digit & (pos >= int_start[token_of]) & (pos < int_end[token_of])
+    # Peso de cada dígito (10^posição a partir do fim da parte inteira); de 10^3 em diante o valor já passou de 255
+    exponent = np.clip(int_end[token_of] - 1 - pos, 0, 3)
+    contrib = np.where(in_int, (b.astype(np.int64) - ord('0')) * _POW10[exponent], 0)
+    values = _count_in_tokens(contrib, starts, ends)
+    return _check_range(np.where(has_minus, -values, values)[valid])
+
+
+def _check_range(values):
+    if values.size and (values.min() < 0 or values.max() > 255):
+        bad = values[(values < 0) | (values > 255)][0]
+        raise ValueError(f"Valor de pixel fora da faixa 0..255: {bad}")
+    return values.astype(np.uint8)
+
+
+def parse_text_pixels(content, signed=True):
+    """Pixels uint8 de um texto já carregado em memória (signed como em parse_bytes)."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if content.startswith(_UTF8_BOM):
+        content = content[len(_UTF8_BOM):]
+    return parse_bytes(content, signed)
+
+
+def iter_text_pixels(path, chunk_bytes=TEXT_CHUNK_BYTES, signed=True):
+    """Lê o arquivo em pedaços e gera os pixels de cada um (o número partido no fim do pedaço vai para o próximo).
+    signed como em parse_bytes."""
+    with open(path, 'rb') as f:
+        carry = b""
+        first = True
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            if first:
+                chunk = chunk[len(_UTF8_BOM):] if chunk.startswith(_UTF8_BOM) else chunk
+                first = False
+            data = carry + chunk
+            cut = max(data.rfind(bytes([c])) for c in _SEPARATORS) + 1 # depois do último separador
+            if cut > 0:
+                yield parse_bytes(data[:cut], signed)
+            carry = data[cut:]
+        if carry:
+            yield parse_bytes(carry, signed)
+
+
+def read_text_pixels(path, chunk_bytes=TEXT_CHUNK_BYTES, signed=True):
+    """Todos os pixels de um arquivo texto/ASCII como array 1D uint8."""
+    parts = list(iter_text_pixels(path, chunk_bytes, signed))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.uint8)
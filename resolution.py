@@ -0,0 +1,109 @@
+# resolution.py
+# Inferência de largura x altura de arquivos RAW sem cabeçalho.
+# Os candidatos são os pares de divisores do número de pixels (obtidos pela fatoração, sem testar
+# todos os números até a raiz). Cada largura recebe uma nota pela correlação entre cada pixel e o
+# pixel "de baixo" (w posições adiante): na largura certa as linhas vizinhas são parecidas. Os múltiplos
+# da largura certa (2w, 3w...) também pontuam alto, pois comparam linhas a 2, 3... de distância; entre
+# notas parecidas, a menor largura que divide a mais bem colocada é a certa.
+import math
+
+import numpy as np
+
+# Trechos comparados por largura candidata e tamanho de cada trecho (em pixels)
+SAMPLE_SEGMENTS = 64
+SEGMENT_PIXELS = 4096
+# Candidatos com proporção mais alongada que isso (ou lado menor que MIN_SIDE) vão para o fim da lista
+MAX_ASPECT = 6
+MIN_SIDE = 8
+# Notas com diferença menor que isso empatam e o desempate é pela forma mais quadrada
+SCORE_RESOLUTION = 0.02
+# Abaixo dessa correlação as linhas não se parecem (ruído, imagem constante): não há múltiplo a corrigir
+MIN_ROW_CORRELATION = 0.5
+
+
+def factorize(n):
+    """{primo: expoente} de n, por divisão por 2, 3 e números 6k +/- 1 até a raiz do que sobra."""
+    factors = {}
+    for p in (2, 3):
+        while n % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            n //= p
+    p = 5
+    while p * p <= n:
+        for q in (p, p + 2):
+            while n % q == 0:
+                factors[q] = factors.get(q, 0) + 1
+                n //= q
+        p += 6
+    if n > 1:
+        factors[n] = factors.get(n, 0) + 1
+    return factors
+
+
+def divisors(n):
+    """Todos os divisores de n em ordem crescente, gerados a partir da fatoração."""
+    if n < 1:
+        return []
+    divs = [1]
+    for p, k in factorize(n).items():
+        divs = [d * p ** e for d in divs for e in range(k + 1)]
+    return sorted(divs)
+
+
+def candidate_resolutions(size):
+    """Todos os pares (largura, altura) com largura * altura == size."""
+    return [(w, size // w) for w in divisors(size)]
+
+
+def is_plausible(w, h):
+    return min(w, h) >= MIN_SIDE and max(w, h) <= MAX_ASPECT * min(w, h)
+
+
+def row_correlation(flat, width, segments=SAMPLE_SEGMENTS, length=SEGMENT_PIXELS):
+    """Correlação entre trechos espalhados pelo arquivo e os trechos 'width' pixels adiante
+    (a linha de baixo, se a largura estiver certa). Só os trechos amostrados são lidos do disco."""
+    n = flat.size
+    length = min(length, n - width)
+    if length < 2:
+        return 0.0
+    last = n - width - length # maior início possível de um trecho
+    starts = np.linspace(0, last, num=min(segments, last + 1)).astype(np.int64)
+    idx = (starts[:, None] + np.arange(length)).ravel()
+    a = flat[idx].astype(np.float32)
+    b = flat[idx + width].astype(np.float32)
+    a -= a.mean()
+    b -= b.mean()
+    denom = math.sqrt(float(np.dot(a, a)) * float(np.dot(b, b)))
+    return float(np.dot(a, b)) / denom if denom > 0 else 0.0
+
+
+def rank_resolutions(data):
+    """Candidatos (largura, altura, nota) do mais provável para o menos provável.
+    Primeiro os de proporção plausível, ordenados pela correlação entre linhas; empates (ex.: ruído ou
+    imagem constante) ficam com a forma mais quadrada. Se a primeira largura for múltiplo de outra com
+    nota quase igual (ex.: 1000x1000 e 500x2000), a menor delas vai para o início: a forma mais quadrada
+    seria a largura dobrada de uma imagem em retrato."""
+    flat = data.reshape(-1)
+    size = flat.size
+    ranked = []
+    for w, h in candidate_resolutions(size):
+        score = row_correlation(flat, w) if h > 1 else 0.0
+        ranked.append((w, h, score))
+    ranked.sort(key=lambda c: (not is_plausible(c[0], c[1]),
+                               -round(c[2] / SCORE_RESOLUTION),
+                               abs(math.log(c[0] / c[1]))))
+    best = ranked[0]
+    if best[2] >= MIN_ROW_CORRELATION:
+        divisors_of_best = [c for c in ranked if c[0] < best[0] and best[0] % c[0] == 0
+                            and is_plausible(c[0], c[1]) and c[2] >= best[2] - SCORE_RESOLUTION]
+        if divisors_of_best:
+            base = min(divisors_of_best, key=lambda c: c[0])
+            ranked.remove(base)
+            ranked.insert(0, base)
+    return ranked
+
+
+def best_resolution(data):
+    """(largura, altura) mais provável para os pixels de 'data'."""
+    w, h, _ = rank_resolutions(data)[0]
+    return w, h
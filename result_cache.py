@@ -0,0 +1,135 @@
+# result_cache.py
+# Cache de resultados por bloco, endereçado por conteúdo e limitado em bytes (descarte LRU).
+# Sem dependência do Qt: os valores guardados são opacos (arrays, tuplas, pixmaps...).
+import sys
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Orçamento padrão de memória do cache
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def mapped_file_key(arr):
+    """Chave de um array mapeado somente leitura de um arquivo (aberto por pu.open_raw_memmap no modo 'r',
+    ou visão dele) pela identidade do arquivo no momento do mapeamento (dispositivo, inode, data de
+    modificação e tamanho, do os.fstat guardado em 'file_stat'), posição dos pixels no arquivo, forma,
+    strides e tipo. Não lê os pixels. None se o array não vem de um arquivo assim."""
+    root = arr
+    while isinstance(root, np.ndarray) and not isinstance(root.base, mmap.mmap):
+        root = root.base
+    st = getattr(root, "file_stat", None)
+    if not isinstance(root, np.memmap) or st is None or root.mode != 'r':
+        # Em memória, mapeado com escrita (o conteúdo pode mudar sem mudar o arquivo) ou sem a identidade
+        # de quando foi mapeado (o caminho pode ter sido substituído desde então)
+        return None
+    offset = root.offset + arr.__array_interface__["data"][0] - root.__array_interface__["data"][0]
+    ident = (root.filename, st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size,
+             offset, arr.shape, arr.strides, arr.dtype.str)
+    return hashlib.blake2b(repr(ident).encode(), digest_size=16).hexdigest()
+
+
+def array_key(arr):
+    """Hash do conteúdo de um array (forma, tipo e bytes). Arrays mapeados somente leitura de um arquivo
+    usam a identidade do arquivo (mapped_file_key): ler e somar todos os bytes custaria o mesmo que
+    carregar a imagem, justamente o que o memmap evita."""
+    if arr is None:
+        return None
+    key = mapped_file_key(arr)
+    if key is not None:
+        return key
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((arr.shape, arr.dtype.str)).encode())
+    h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+
+def make_key(block_type, parameters, input_keys, ignore=()):
+    """Chave de um resultado: tipo do bloco, parâmetros e chaves das entradas.
+    Como a chave de cada entrada já resume tudo que veio antes dela, a cadeia inteira fica endereçada
+    pelo conteúdo sem precisar recalcular o hash dos arrays intermediários."""
+    params = sorted((k, repr(v)) for k, v in parameters.items() if k not in ignore)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((block_type, params, list(input_keys))).encode())
+    return h.hexdigest()
+
+
+def nbytes_of(value):
+    """Estimativa do tamanho em memória de um valor guardado no cache."""
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes_of(v) for v in value.values())
+    if all(hasattr(value, attr) for attr in ("width", "height", "depth")): # QPixmap / QImage
+        return value.width() * value.height() * max(value.depth(), 8) // 8
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Cache LRU com orçamento em bytes e contadores de acertos/falhas (seguro entre threads)."""
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # chave -> (valor, bytes), do menos para o mais recente
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Retorna o valor guardado (marcando-o como recente) ou None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Guarda um valor e descarta os menos usados até caber no orçamento."""
+        if value is None:
+            return
+        if nbytes is None:
+            nbytes = nbytes_of(value)
+        if nbytes > self.max_bytes:
+            return # maior que o cache inteiro: não vale a pena guardar
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, old_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= old_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
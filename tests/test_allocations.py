@@ -0,0 +1,80 @@
+# Auditoria de alocações de processing_utils: com entrada 2D uint8 nenhuma função deve criar cópias
+# redundantes da imagem inteira. Os limites são de pico de memória medido pelo tracemalloc (o NumPy
+# registra nele os buffers dos arrays), em "quadros": bytes de uma imagem do mesmo tamanho.
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import processing_utils as pu
+
+SHAPE = (1024, 1024)
+FRAME = SHAPE[0] * SHAPE[1] # bytes de um quadro uint8
+FLOAT_FRAME = 8 * FRAME # bytes de um quadro float64 (área de trabalho das convoluções)
+SLACK = 128 * 1024 # objetos pequenos (kernels, listas de faixas, LUTs)
+
+
+@pytest.fixture
+def img():
+    return np.random.default_rng(0).integers(0, 256, SHAPE, dtype=np.uint8)
+
+
+@pytest.fixture(autouse=True)
+def single_thread(monkeypatch):
+    # Com várias threads o pico soma as faixas em andamento; uma thread deixa a medida determinística
+    monkeypatch.setattr(pu, "NUM_WORKERS", 1)
+
+
+def peak_bytes(func):
+    """Pico de memória alocada durante func() (uma chamada antes aquece caches, ex.: do FFT)."""
+    func()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_ensure_uint8_returns_input_without_copy(img):
+    assert pu.ensure_uint8(img) is img
+
+
+def test_ensure_uint8_converts_other_inputs():
+    out = pu.ensure_uint8(np.array([[-5.0, 300.0], [12.7, 0.0]]))
+    assert out.dtype == np.uint8
+    assert out.tolist() == [[0, 255], [12, 0]]
+
+
+def test_apply_lut_allocates_only_output(img):
+    # Saída + o temporário intp de uma faixa do np.take
+    limit = FRAME + 8 * pu.LUT_BAND_PIXELS + SLACK
+    assert peak_bytes(lambda: pu.apply_lut(img, pu.brightness_lut(10))) <= limit
+
+
+def test_compute_histogram_does_not_copy_image(img):
+    # Só o temporário intp de uma faixa do bincount: nada proporcional à imagem
+    limit = 8 * pu.LUT_BAND_PIXELS + SLACK
+    assert peak_bytes(lambda: pu.compute_histogram(img)) <= limit
+
+
+@pytest.mark.parametrize("method, kernel", [
+    ("box", np.ones((3, 3)) / 9),
+    ("separable", np.outer([1, 2, 1], [1, 2, 1]) / 16.5),
+    ("direct", np.arange(25, dtype=np.float64).reshape(5, 5) / 300),
+    ("fft", np.arange(25, dtype=np.float64).reshape(5, 5) / 300),
+])
+def test_convolve2d_working_memory(img, method, kernel):
+    # No máximo 3.5 quadros float64 de trabalho (entrada com borda, acumulador, distância ao inteiro)
+    # mais a saída uint8: nenhuma cópia extra da imagem por tap do kernel
+    limit = 3.5 * FLOAT_FRAME + FRAME + SLACK
+    assert peak_bytes(lambda: pu.convolve2d(img, kernel, method)) <= limit
+
+
+@pytest.mark.parametrize("ksize, frames", [
+    (3, 3 * 3 + 2), # ordenação parcial: uma cópia por posição da janela, mais borda e saída
+    (9, 5), # histograma deslizante: não depende do tamanho da janela
+    (15, 5),
+])
+def test_median_filter_memory(img, ksize, frames):
+    assert peak_bytes(lambda: pu.median_filter(img, ksize)) <= frames * FRAME + SLACK
@@ -0,0 +1,38 @@
+# Os caminhos rápidos da convolução (caixa, separável, FFT) devem dar exatamente os pixels da soma direta:
+# no modo 'auto' o caminho depende do tamanho da imagem, e o resultado não pode depender dele.
+import numpy as np
+import pytest
+
+import processing_utils as pu
+
+
+def disk_kernel(radius):
+    y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    k = (x * x + y * y <= radius * radius).astype(np.float64)
+    return k / k.sum()
+
+
+KERNELS = {
+    "disco 15x15": disk_kernel(7),
+    "9x9 uma casa decimal": np.round(np.random.default_rng(1).uniform(0, 0.3, (9, 9)), 1),
+    "caixa 11x11": np.ones((11, 11)) / 121.0,
+    "laplaciano": np.array([[0, 1, 0], [1, -4, 1], [0, 1, 0]], dtype=np.float64),
+}
+
+
+@pytest.fixture(scope="module")
+def img():
+    return np.random.default_rng(0).integers(0, 256, (600, 600), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("name", KERNELS)
+def test_fft_matches_direct(img, name):
+    kernel = KERNELS[name]
+    direct = pu.convolve2d(img, kernel, 'direct', workers=1)
+    assert np.array_equal(pu.convolve2d(img, kernel, 'fft', workers=1), direct)
+
+
+@pytest.mark.parametrize("name", KERNELS)
+def test_auto_matches_direct(img, name):
+    kernel = KERNELS[name]
+    assert np.array_equal(pu.convolve2d(img, kernel), pu.convolve2d(img, kernel, 'direct'))
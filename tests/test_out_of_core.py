@@ -0,0 +1,64 @@
+# Execução em lote fora da memória (--out-of-core): as cadeias lidas de um RAW mapeado em memória devem
+# gravar exatamente o mesmo resultado da execução em memória.
+import os
+
+import numpy as np
+import pytest
+
+import pipeline
+import processing_utils as pu
+
+SHAPE = (300, 200)
+
+
+def make_workflow(path, convolution_params):
+    reader = pipeline.Node(1, pipeline.RAW_INPUT, {"width": SHAPE[1], "height": SHAPE[0]})
+    punctual = pipeline.Node(2, pipeline.PUNCTUAL, {"operation": "Brilho", "brightness": 20})
+    conv = pipeline.Node(3, pipeline.CONVOLUTION, convolution_params)
+    writer = pipeline.Node(4, pipeline.RAW_OUTPUT)
+    punctual.input_connections[0] = reader
+    conv.input_connections[0] = punctual
+    writer.input_connections[0] = conv
+    pipeline.save_workflow(path, [reader, punctual, conv, writer])
+
+
+@pytest.mark.parametrize("params", [
+    {"preset": "Média"},
+    {"preset": "Mediana", "median_size": 5},
+])
+def test_out_of_core_matches_in_memory(tmp_path, monkeypatch, params):
+    calls = []
+    run_out_of_core = pu.run_out_of_core
+    monkeypatch.setattr(pu, "run_out_of_core", lambda *a, **kw: calls.append(a) or run_out_of_core(*a, **kw))
+    img = np.random.default_rng(0).integers(0, 256, SHAPE, dtype=np.uint8)
+    (tmp_path / "in").mkdir()
+    img.tofile(tmp_path / "in" / "img.raw")
+    workflow = tmp_path / "fluxo.json"
+    make_workflow(workflow, params)
+
+    for mode, out_of_core in (("mem", False), ("ooc", True)): # no mesmo processo, para contar as chamadas
+        (tmp_path / mode).mkdir()
+        pipeline._run_file((workflow, str(tmp_path / "in" / "img.raw"), str(tmp_path / mode), ".raw", out_of_core))
+
+    assert len(calls) == 1 # só a execução --out-of-core passou pelas faixas em disco
+    expected = np.fromfile(tmp_path / "mem" / "img_4.raw", dtype=np.uint8)
+    assert np.array_equal(np.fromfile(tmp_path / "ooc" / "img_4.raw", dtype=np.uint8), expected)
+    assert os.listdir(tmp_path / "ooc") == ["img_4.raw"] # temporários apagados
+
+
+def test_apply_chain_out_of_core_small_bands(tmp_path):
+    img = np.random.default_rng(1).integers(0, 256, SHAPE, dtype=np.uint8)
+    ops = [("median", 3), ("conv", np.ones((5, 5)) / 25.0), ("lut", pu.brightness_lut(-10))]
+    out = pu.apply_chain_out_of_core(img, ops, tmp_path / "out.raw", band_rows=7)
+    assert np.array_equal(np.asarray(out), pu.apply_chain(img, ops))
+
+
+def test_run_batch_out_of_core(tmp_path):
+    img = np.random.default_rng(2).integers(0, 256, SHAPE, dtype=np.uint8)
+    (tmp_path / "in").mkdir()
+    img.tofile(tmp_path / "in" / "img.raw")
+    workflow = tmp_path / "fluxo.json"
+    make_workflow(workflow, {"preset": "Laplaciano"})
+    [summary] = pipeline.run_batch(workflow, tmp_path / "in", tmp_path / "out", workers=1, out_of_core=True)
+    expected = pu.convolve2d(pu.apply_lut(img, pu.brightness_lut(20)), [[0, 1, 0], [1, -4, 1], [0, 1, 0]])
+    assert np.array_equal(np.fromfile(summary["outputs"][0], dtype=np.uint8).reshape(SHAPE), expected)
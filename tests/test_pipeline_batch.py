@@ -0,0 +1,31 @@
+# Seleção dos arquivos do lote: .txt só é lido quando o bloco de leitura do fluxo está no modo texto.
+import os
+
+import numpy as np
+import pytest
+
+import pipeline
+
+
+def make_workflow(path, reader_params):
+    reader = pipeline.Node(1, pipeline.RAW_INPUT, reader_params)
+    writer = pipeline.Node(2, pipeline.RAW_OUTPUT)
+    writer.input_connections[0] = reader
+    pipeline.save_workflow(path, [reader, writer])
+
+
+@pytest.mark.parametrize("reader_params, outputs", [
+    ({"format_index": 0, "width": 8, "height": 4}, ["img_2.raw"]), # binário: anotações ficam de fora
+    ({"format_index": 1, "width": 2, "height": 2}, ["img_2.raw", "pixels_2.raw"]),
+])
+def test_txt_only_in_text_mode(tmp_path, reader_params, outputs):
+    (tmp_path / "in").mkdir()
+    if reader_params["format_index"] == 1: # no modo texto o .raw também é texto (como Imagens/circulo.raw)
+        (tmp_path / "in" / "img.raw").write_text("5 6\n7 8\n")
+    else:
+        np.arange(32, dtype=np.uint8).tofile(tmp_path / "in" / "img.raw")
+    (tmp_path / "in" / "pixels.txt").write_text("1 2\n3 4\n")
+    workflow = tmp_path / "fluxo.json"
+    make_workflow(workflow, reader_params)
+    pipeline.run_batch(workflow, tmp_path / "in", tmp_path / "out", workers=1)
+    assert sorted(os.listdir(tmp_path / "out")) == outputs
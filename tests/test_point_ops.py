@@ -0,0 +1,33 @@
+# Operações pontuais do bloco de Processamento Pontual: cada uma vira uma LUT de 256 entradas.
+import numpy as np
+import pytest
+
+import pipeline
+import processing_utils as pu
+
+LEVELS = np.arange(256, dtype=np.float64)
+
+
+@pytest.mark.parametrize("params, expected", [
+    ({"operation": "Brilho", "brightness": 40}, np.clip(LEVELS + 40, 0, 255)),
+    ({"operation": "Limiar", "threshold": 100}, np.where(LEVELS >= 100, 255, 0)),
+    ({"operation": "Negativo"}, 255 - LEVELS),
+    ({"operation": "Gama", "gamma": 0.5}, np.round(255 * (LEVELS / 255) ** 0.5)),
+    ({"operation": "Contraste", "stretch_low": 50, "stretch_high": 150},
+     np.clip(np.round((LEVELS - 50) * (255 / 100)), 0, 255)),
+])
+def test_punctual_lut(params, expected):
+    assert np.array_equal(pipeline.punctual_lut(params), expected.astype(np.uint8))
+
+
+def test_new_point_ops_fuse_into_one_lut():
+    reader = pipeline.Node(1, pipeline.RAW_INPUT)
+    negative = pipeline.Node(2, pipeline.PUNCTUAL, {"operation": "Negativo"})
+    gamma = pipeline.Node(3, pipeline.PUNCTUAL, {"operation": "Gama", "gamma": 2.0})
+    negative.input_connections[0] = reader
+    gamma.input_connections[0] = negative
+    img = np.random.default_rng(0).integers(0, 256, (40, 30), dtype=np.uint8)
+    plan = pipeline.compile_workflow([reader, negative, gamma])
+    assert [len(s.ops) for s in plan.steps if s.kind == "fused"] == [1] # as duas LUTs compostas
+    pipeline.run_workflow([reader, negative, gamma], img)
+    assert np.array_equal(gamma.output_data, pu.apply_lut(pu.apply_lut(img, pu.negative_lut()), pu.gamma_lut(2.0)))
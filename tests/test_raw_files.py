@@ -0,0 +1,51 @@
+# Gravação de RAW sobre o próprio arquivo de origem: o memmap da leitura não pode ser truncado no meio
+# da gravação (o arquivo só é substituído no fim).
+import os
+import stat
+
+import numpy as np
+import pytest
+
+import pipeline
+import raw_container
+
+SHAPE = (512, 384)
+
+
+@pytest.mark.parametrize("ext", [".raw", raw_container.CONTAINER_EXTENSION, ".craw"])
+def test_save_over_mapped_source(tmp_path, ext):
+    path = tmp_path / f"img{ext}"
+    img = np.random.default_rng(0).integers(0, 256, SHAPE, dtype=np.uint8)
+    raw_container.save_raw(path, img)
+    params = {"width": SHAPE[1], "height": SHAPE[0]}
+    src = pipeline.load_input(str(path), params) # Leitura -> Gravação no mesmo arquivo
+    raw_container.save_raw(path, src)
+    assert np.array_equal(src, img) # a origem mapeada continua intacta
+    assert np.array_equal(pipeline.load_input(str(path), params), img)
+    assert os.listdir(tmp_path) == [path.name] # sem temporários
+
+
+def test_failed_save_keeps_file_and_mode(tmp_path):
+    path = tmp_path / "img.praw"
+    raw_container.save_raw(path, np.arange(16, dtype=np.uint8).reshape(4, 4))
+    os.chmod(path, 0o640)
+    with pytest.raises(ValueError): # mais dimensões que o cabeçalho aceita
+        raw_container.save_raw(path, np.zeros((1, 1, 1, 4, 4), dtype=np.uint8))
+    assert np.array_equal(raw_container.open_container(path), np.arange(16).reshape(4, 4))
+    raw_container.save_raw(path, np.zeros((4, 4), dtype=np.uint8))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["img.praw"]
+
+
+def test_replace_refused_gives_clear_error(tmp_path, monkeypatch):
+    # Simula o Windows, que não deixa substituir um arquivo mapeado em memória
+    path = tmp_path / "img.raw"
+    np.arange(16, dtype=np.uint8).tofile(path)
+
+    def refuse(src, dst):
+        raise PermissionError(13, "Acesso negado")
+    monkeypatch.setattr(os, "replace", refuse)
+    with pytest.raises(PermissionError, match="em uso"):
+        raw_container.save_raw(path, np.zeros((4, 4), dtype=np.uint8))
+    assert np.array_equal(np.fromfile(path, dtype=np.uint8), np.arange(16))
+    assert os.listdir(tmp_path) == ["img.raw"]
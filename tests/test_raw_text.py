@@ -0,0 +1,31 @@
+# Leitura de texto: o conversor (signed=False) pula tokens com sinal como o filtro isdigit() antigo;
+# a interface (signed=True) continua recusando números negativos.
+import numpy as np
+import pytest
+
+import raw_text
+
+
+def old_converter(text):
+    """Filtro do converter_binario_raw.py original."""
+    return [int(float(x)) for x in text.split() if x.replace('.', '', 1).isdigit()]
+
+
+def test_unsigned_mode_skips_signed_tokens_like_old_converter():
+    rng = np.random.default_rng(0)
+    tokens = ["12", "-5", "7.9", "-3.2", "abc", "1.2.3", ".5", "4.", "--1", "2-3", "255", "0", "+4"]
+    text = " ".join(rng.choice(tokens, 500)) + "\n"
+    assert raw_text.parse_text_pixels(text, signed=False).tolist() == old_converter(text)
+
+
+def test_unsigned_mode_in_chunks(tmp_path):
+    path = tmp_path / "img.txt"
+    text = "\n".join(f"{i % 256} -{i % 7}" for i in range(5000))
+    path.write_text(text)
+    pixels = raw_text.read_text_pixels(path, chunk_bytes=1000, signed=False)
+    assert pixels.tolist() == old_converter(text)
+
+
+def test_signed_mode_rejects_negative():
+    with pytest.raises(ValueError, match="-5"):
+        raw_text.parse_text_pixels("1 2 -5 3")
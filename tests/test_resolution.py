@@ -0,0 +1,31 @@
+# Inferência de resolução de RAW sem cabeçalho: imagens em retrato e altas não podem ser confundidas com
+# a largura dobrada (que também tem linhas parecidas, só que a duas de distância).
+import numpy as np
+import pytest
+
+import resolution
+
+
+def smooth_image(h, w, seed=0):
+    """Imagem com variação suave nas duas direções e um pouco de ruído."""
+    y, x = np.mgrid[0:h, 0:w]
+    noise = np.random.default_rng(seed).normal(0, 5, (h, w))
+    return (128 + 60 * np.sin(x / 37.0) + 50 * np.cos(y / 23.0) + noise).clip(0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("w, h", [
+    (500, 2000), (400, 1600), (700, 2100), # retrato: antes saíam como 1000x1000, 800x800, 1400x1050
+    (300, 1500), # alta (proporção 1:5)
+    (2000, 500), (1000, 1000), (640, 480),
+])
+def test_best_resolution(w, h):
+    assert resolution.best_resolution(smooth_image(h, w).ravel()) == (w, h)
+
+
+def test_noise_keeps_squarest_shape():
+    noise = np.random.default_rng(1).integers(0, 256, 1000 * 1000, dtype=np.uint8)
+    assert resolution.best_resolution(noise) == (1000, 1000)
+
+
+def test_candidates_are_all_divisor_pairs():
+    assert resolution.candidate_resolutions(12) == [(1, 12), (2, 6), (3, 4), (4, 3), (6, 2), (12, 1)]
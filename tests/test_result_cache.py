@@ -0,0 +1,75 @@
+# Chaves do cache para imagens mapeadas de arquivo: pela identidade do arquivo, sem ler os pixels.
+import os
+
+import numpy as np
+
+import processing_utils as pu
+import raw_container
+import result_cache
+
+
+def test_memmap_key_uses_file_identity(tmp_path, monkeypatch):
+    path = tmp_path / "img.raw"
+    img = np.random.default_rng(0).integers(0, 256, (64, 48), dtype=np.uint8)
+    img.tofile(path)
+    mapped = pu.reshape_view(pu.map_raw_file(path), img.shape)
+    monkeypatch.setattr(result_cache.hashlib, "blake2b", _no_content_hash(result_cache.hashlib.blake2b))
+    key = result_cache.array_key(mapped)
+    assert key == result_cache.array_key(pu.reshape_view(pu.map_raw_file(path), img.shape))
+    assert key != result_cache.array_key(pu.reshape_view(pu.map_raw_file(path), (48, 64)))
+    assert key != result_cache.array_key(mapped[1:]) # outra posição no arquivo
+    raw_container.save_raw(path, img[::-1]) # arquivo regravado: outra chave
+    assert key != result_cache.array_key(pu.reshape_view(pu.map_raw_file(path), img.shape))
+
+
+def test_key_of_old_map_survives_replace(tmp_path):
+    path = tmp_path / "img.raw"
+    raw_container.save_raw(path, np.zeros((32, 32), dtype=np.uint8))
+    old = pu.reshape_view(pu.map_raw_file(path), (32, 32))
+    raw_container.save_raw(path, np.full((32, 32), 200, dtype=np.uint8)) # os.replace sobre o mapeado
+    new = pu.reshape_view(pu.map_raw_file(path), (32, 32))
+    assert old.max() == 0 and new.min() == 200
+    assert result_cache.array_key(old) != result_cache.array_key(new)
+
+
+def test_map_without_recorded_identity_hashes_content(tmp_path):
+    path = tmp_path / "img.raw"
+    img = np.arange(64, dtype=np.uint8).reshape(8, 8)
+    img.tofile(path)
+    mapped = np.memmap(path, dtype=np.uint8, mode='r', shape=img.shape) # sem pu.open_raw_memmap
+    assert result_cache.mapped_file_key(mapped) is None
+    assert result_cache.array_key(mapped) == result_cache.array_key(img)
+
+
+def test_container_memmap_key_uses_file_identity(tmp_path):
+    path = tmp_path / "img.praw"
+    img = np.random.default_rng(1).integers(0, 256, (32, 40), dtype=np.uint8)
+    raw_container.save_raw(path, img)
+    mapped = raw_container.open_container(path)
+    assert result_cache.mapped_file_key(mapped) is not None
+    assert result_cache.mapped_file_key(np.asfortranarray(img)) is None
+
+
+def test_in_memory_and_writable_maps_hash_content(tmp_path):
+    path = tmp_path / "img.raw"
+    img = np.arange(64, dtype=np.uint8).reshape(8, 8)
+    img.tofile(path)
+    writable = pu.open_raw_memmap(path, img.shape, mode='r+')
+    assert result_cache.mapped_file_key(writable) is None
+    assert result_cache.array_key(writable) == result_cache.array_key(img.copy())
+
+
+def _no_content_hash(blake2b):
+    """blake2b que falha se receber os bytes dos pixels (só a descrição do arquivo pode ser somada)."""
+    class Guarded:
+        def __init__(self, data=b"", **kwargs):
+            self.h = blake2b(**kwargs)
+            self.update(data)
+
+        def update(self, data):
+            assert len(data) < 1024
+            self.h.update(data)
+
+        def hexdigest(self):
+            return self.h.hexdigest()
+    return Guarded